@@ -32,6 +32,14 @@ do
 	cd $folder	
 	testlist=(`ls ${prefix}*.d`);
 	cd ../../
+
+	# compile the whole subtask with one warm compiler per worker
+	rm -f "$OUTPUT_DIRECTORY$folder/"*.s
+	if command -v python3; then
+		python3 "$SOURCE_DIRECTORY/main.py" -b -o "$OUTPUT_DIRECTORY$folder" "$TEST_DIRECTORY$folder"
+	else
+		python "$SOURCE_DIRECTORY/main.py" -b -o "$OUTPUT_DIRECTORY$folder" "$TEST_DIRECTORY$folder"
+	fi
 	for filelist in ${testlist[*]}
 	do
 		filename=`echo $filelist | cut -d'.' -f1`;
@@ -40,12 +48,7 @@ do
 		program_input="$filename.in"
 		report_filename="$filename.report.txt"
 		echo "Running Test $filename -------------------------------------"
-		if command -v python3; then
-			python3 "$SOURCE_DIRECTORY/main.py" -i "$TEST_DIRECTORY/$folder/$filelist" -o "$OUTPUT_DIRECTORY/$folder/$output_asm"
-		else
-			python "$SOURCE_DIRECTORY/main.py" -i "$TEST_DIRECTORY/$folder/$filelist" -o "$OUTPUT_DIRECTORY/$folder/$output_asm"
-		fi
-		if [ $? -eq 0 ]; then
+		if [ -f "$OUTPUT_DIRECTORY$folder/$output_asm" ]; then
 			echo "MIPS Generated Successfuly!"
 		
 		timeout 10 spim -a -f "$OUTPUT_DIRECTORY$folder/$output_asm" < "$TEST_DIRECTORY$folder/$program_input" > "$OUTPUT_DIRECTORY$folder/$output_filename"
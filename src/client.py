@@ -0,0 +1,74 @@
+"""
+Thin client for the compile server (main.py --serve).
+Drop in replacement for `main.py -i <inputfile> -o <outputfile>`.
+
+Falls back to compiling in this process if no server is running.
+"""
+import sys, getopt, os
+import socket
+
+from protocol import default_socket_path, send_message, recv_message
+
+help_message = '''
+client.py [--socket <socket>] -i <inputfile> -o <outputfile>
+'''
+
+
+def request(code, socket_path=default_socket_path):
+	s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		s.connect(socket_path)
+		f = s.makefile('rwb')
+		send_message(f, {'code': code})
+		response = recv_message(f)
+		f.close()
+	finally:
+		s.close()
+
+	if response is None:
+		raise ConnectionError("compile server closed the connection")
+	return response
+
+
+def main(argv):
+	socket_path = default_socket_path
+	inputfile = ''
+	outputfile = ''
+	try:
+		opts, args = getopt.getopt(argv,"hi:o:",["ifile=","ofile=","socket="])
+	except getopt.GetoptError:
+		print(help_message)
+		sys.exit(2)
+
+	for opt, arg in opts:
+		if opt == '-h':
+			print(help_message)
+			sys.exit()
+		elif opt in ("-i", "--ifile"):
+			inputfile = arg
+		elif opt in ("-o", "--ofile"):
+			outputfile = arg
+		elif opt == "--socket":
+			socket_path = arg
+
+	with open(inputfile, "r") as input_file:
+		code = input_file.read()
+
+	try:
+		response = request(code, socket_path)
+	except OSError:
+		# no server, compile here
+		main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+		os.execv(sys.executable, [sys.executable, main_py, '-i', inputfile, '-o', outputfile])
+
+	if 'mips' not in response:
+		error = response['error']
+		print(f"{response['status']}: l{error.get('line', 0)}-c{error.get('col', 0)}:: {error['message']}", file=sys.stderr)
+		sys.exit(1)
+
+	with open(outputfile, "w") as output_file:
+		output_file.write(response['mips'])
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,36 @@
+from tac import Program
+
+
+class CompilationContext():
+	"""
+	Mutable state of a single compilation.
+
+	Every generate_tac call creates a fresh context and hands it to all
+	visitors, so a process can compile many programs one after another
+	without state from one program leaking into the next.
+	"""
+
+	def __init__(self):
+		# symbol table phase
+		self.symbol_tables = []
+		self.global_scope = None
+		self.scopes = {}				# id(node) -> SymbolTable of the scope the node opens
+		self.resolved = {}				# id(node) -> symbol, see NameResolver
+		self.data_pointer = 0
+		self.symbol_stack = []			# last type:Type / variable:Variable visited
+		self.interface_stack = []
+		self.class_stack = []
+		self.current_access_mode = None
+
+		# code generation phase
+		self.stack = []					# variables (types) of expressions being lowered
+		self.stack_of_for_and_while_labels = []	# (label_for_continue, label_for_break)
+		self.stack_of_functions = []
+		self.program = Program()		# three address code
+		self.from_assign_flag = False
+
+
+	def inc_data_pointer(self, size):
+		cur = self.data_pointer
+		self.data_pointer += size
+		return cur
\ No newline at end of file
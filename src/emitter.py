@@ -0,0 +1,66 @@
+import io
+
+
+# kinds of records in an Emitter buffer
+INSTRUCTION = 0
+LABEL = 1
+COMMENT = 2
+DIRECTIVE = 3
+
+
+class Emitter():
+	"""
+	Append only buffer of assembly records.
+
+	Visitors append (kind, op, args, comment) tuples instead of building
+	strings; the text is rendered once, when the whole program is done.
+	Buffers can be joined with extend (e.g. init code collected while
+	visiting classes is placed in main).
+	"""
+
+	def __init__(self):
+		self.records = []
+
+	def __len__(self):
+		return len(self.records)
+
+	def emit(self, op, *args, comment=None):
+		self.records.append((INSTRUCTION, op, args, comment))
+
+	def label(self, name):
+		self.records.append((LABEL, name, (), None))
+
+	def comment(self, text):
+		self.records.append((COMMENT, None, (), text))
+
+	def directive(self, op, *args, label=None):
+		if label:
+			self.label(label)
+		self.records.append((DIRECTIVE, op, args, None))
+
+	def extend(self, other):
+		self.records.extend(other.records)
+
+	def instructions_count(self):
+		return sum(1 for r in self.records if r[0] == INSTRUCTION)
+
+
+	def render_lines(self):
+		for kind, op, args, comment in self.records:
+			if kind == LABEL:
+				yield f"{op}:\n"
+			elif kind == COMMENT:
+				yield f"\n\t# {comment}\n"
+			else:
+				line = f"\t{op} {', '.join(str(a) for a in args)}" if args else f"\t{op}"
+				if comment:
+					line += f"\t# {comment}"
+				yield line + "\n"
+
+	def render(self, output_file):
+		output_file.writelines(self.render_lines())
+
+	def getvalue(self):
+		s = io.StringIO()
+		self.render(s)
+		return s.getvalue()
@@ -0,0 +1,92 @@
+from tac import Temp, BRANCHES
+
+
+# control flow of the code of a tac.IRFunction
+
+
+def basic_blocks(code):
+	# [start, end) index ranges of the basic blocks of code
+	leaders = {0}
+	for i, instr in enumerate(code):
+		if instr.op == 'label':
+			leaders.add(i)
+		elif instr.op in BRANCHES or instr.op in ('goto', 'return'):
+			leaders.add(i + 1)
+
+	leaders = sorted(l for l in leaders if l < len(code))
+	return list(zip(leaders, leaders[1:] + [len(code)]))
+
+
+def label_blocks(code, blocks):
+	# label -> number of the block it starts
+	return {code[start].label: n for n, (start, end) in enumerate(blocks) if code[start].op == 'label'}
+
+
+def successors(code, blocks):
+	# successors (block numbers) of each block
+	block_of_label = label_blocks(code, blocks)
+
+	succ = []
+	for n, (start, end) in enumerate(blocks):
+		last = code[end - 1]
+		targets = []
+		# jumps out of the function (runtimeError) do not come back
+		if (last.op in BRANCHES or last.op == 'goto') and last.label in block_of_label:
+			targets.append(block_of_label[last.label])
+		if last.op not in ('goto', 'return') and n + 1 < len(blocks):
+			targets.append(n + 1)
+		succ.append(targets)
+	return succ
+
+
+def defs(instr):
+	return (instr.dst,) if isinstance(instr.dst, Temp) else ()
+
+
+def dominators(blocks, succ):
+	# set of blocks that dominate each block (None for unreachable blocks)
+	preds = [[] for _ in blocks]
+	for n, targets in enumerate(succ):
+		for s in targets:
+			preds[s].append(n)
+
+	dom = [None] * len(blocks)
+	if not blocks:
+		return dom
+	dom[0] = {0}
+	changed = True
+	while changed:
+		changed = False
+		for n in range(1, len(blocks)):
+			reached = [dom[p] for p in preds[n] if dom[p] is not None]
+			if not reached:
+				continue
+			new = set.intersection(*reached) | {n}
+			if new != dom[n]:
+				dom[n] = new
+				changed = True
+	return dom
+
+
+def natural_loops(blocks, succ):
+	# header block -> set of blocks of the loop (back edges to the same
+	# header make one loop)
+	preds = [[] for _ in blocks]
+	for n, targets in enumerate(succ):
+		for s in targets:
+			preds[s].append(n)
+
+	dom = dominators(blocks, succ)
+	loops = {}
+	for n, targets in enumerate(succ):
+		for header in targets:
+			if dom[n] is None or header not in dom[n]:
+				continue
+			body = loops.setdefault(header, {header})
+			worklist = [n]
+			while worklist:
+				m = worklist.pop()
+				if m not in body:
+					body.add(m)
+					worklist.extend(preds[m])
+	return loops
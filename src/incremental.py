@@ -0,0 +1,120 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from lark import logger
+
+from emitter import Emitter
+import my_parser
+
+
+# generated mips of top level function and class declarations, reused
+# while a declaration and everything it can see stay the same
+fragments_path = my_parser.cache_path / 'fragments'
+
+
+@lru_cache(maxsize=None)
+def compiler_digest():
+	# any change to the compiler invalidates every fragment
+	h = hashlib.sha256()
+	src = Path(__file__).parent
+	for f in sorted(src.glob('*.py')) + [my_parser.grammer_file]:
+		h.update(f.name.encode())
+		h.update(f.read_bytes())
+	return h.hexdigest()
+
+
+def type_key(type_):
+	if type_ is None:
+		return 'void'
+	if type_.arr_type:
+		return f'{type_key(type_.arr_type)}[]'
+	return type_.name
+
+
+def function_key(function):
+	return (function.name, function.label, type_key(function.return_type),
+		tuple((f.name, type_key(f.type_)) for f in function.formals))
+
+
+def environment_key(symbol_table):
+	# everything a declaration can see from the global scope:
+	# global variables, function signatures, classes and interfaces
+	variables = [(v.name, type_key(v.type_), v.address) for v in symbol_table.variables.values()]
+	functions = [function_key(f) for f in symbol_table.functions.values()]
+
+	types = []
+	for type_ in symbol_table.types.values():
+		class_ = type_.class_ref
+		if class_ is None:
+			types.append((type_.name, type_.interface_ref is not None))
+			continue
+
+		types.append((
+			class_.name,
+			class_.parent.name if class_.parent else None,
+			tuple((v.name, type_key(v.type_), class_.access_modes.get(v.name)) for v in class_.member_data.values()),
+			tuple((*function_key(f), class_.access_modes.get(f.name)) for f in class_.member_functions.values()),
+		))
+
+	return repr((variables, functions, types))
+
+
+def declaration_key(code, decl, scopes):
+	# variables declared inside decl, with their static addresses
+	tables = [scopes[id(subtree)] for subtree in decl.iter_subtrees_topdown() if id(subtree) in scopes]
+
+	variables = [(v.name, type_key(v.type_), v.address) for t in tables for v in t.variables.values()]
+	return repr((code[decl.meta.start_pos:decl.meta.end_pos], variables))
+
+
+class FragmentCache():
+	"""
+	(data, text) Emitter records of declarations, one pickle file per
+	key in a directory ($DECAF_CACHE_DIR/fragments by default).
+
+	The key hashes the compiler, the declaration's source, its variables
+	and the global environment it is checked against.
+	"""
+
+	def __init__(self, path=fragments_path):
+		self.path = Path(path)
+
+	def key(self, code, decl, scopes, environment):
+		# scopes is context.scopes, environment is environment_key of the
+		# global scope, computed once per program
+		h = hashlib.sha256()
+		h.update(compiler_digest().encode())
+		h.update(environment.encode())
+		h.update(declaration_key(code, decl, scopes).encode())
+		return h.hexdigest()
+
+	def get(self, key):
+		try:
+			with open(self.path / key, 'rb') as f:
+				data, text = pickle.load(f)
+		except FileNotFoundError:
+			return None
+		except Exception as e:
+			logger.debug('Ignoring fragment %s: %s', key, e)
+			return None
+
+		fragment = (Emitter(), Emitter())
+		fragment[0].records = data
+		fragment[1].records = text
+		return fragment
+
+	def put(self, key, fragment):
+		data, text = fragment
+		# temp file and rename, like the parser cache
+		try:
+			self.path.mkdir(parents=True, exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+			with os.fdopen(fd, 'wb') as f:
+				pickle.dump((data.records, text.records), f, pickle.HIGHEST_PROTOCOL)
+			os.replace(tmp, self.path / key)
+		except OSError as e:
+			logger.debug('Could not write fragment %s: %s', key, e)
@@ -0,0 +1,56 @@
+from types import GeneratorType
+
+from lark import Tree
+
+
+class Interpreter():
+	"""
+	lark.visitors.Interpreter without recursion.
+
+	Methods are called by tree.data like in lark (__default__ when there
+	is no method). A method that needs the value of a subtree yields the
+	subtree instead of calling self.visit:
+
+		def add(self, tree):
+			value1 = yield tree.children[0]
+			values = yield from self.visit_children(tree)
+			...
+			return result
+
+	visit runs these generators on an explicit stack, so the depth of the
+	tree (e.g. long a + b + c + ... chains) is not limited by python's
+	recursion limit. Methods without yield are plain functions.
+	"""
+
+	def visit(self, tree):
+		stack = []
+		result = self._call_userfunc(tree)
+		while True:
+			if isinstance(result, GeneratorType):
+				stack.append(result)
+				result = None
+			elif not stack:
+				return result
+
+			try:
+				subtree = stack[-1].send(result)
+			except StopIteration as e:
+				stack.pop()
+				result = e.value
+			else:
+				result = self._call_userfunc(subtree)
+
+	def _call_userfunc(self, tree):
+		return getattr(self, tree.data, self.__default__)(tree)
+
+	def visit_children(self, tree):
+		# use with yield from
+		results = []
+		for child in tree.children:
+			if isinstance(child, Tree):
+				child = yield child
+			results.append(child)
+		return results
+
+	def __default__(self, tree):
+		return (yield from self.visit_children(tree))
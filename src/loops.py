@@ -0,0 +1,256 @@
+from collections import Counter
+
+from flow import basic_blocks, successors, natural_loops, defs
+from tac import Temp, Instr, JUMPS, OVERFLOW_OPS
+
+
+# loop optimizations of the code of a tac.IRFunction, after
+# optimize.promote_variables (variables are temps)
+#
+#	invariant code motion: computations whose operands do not change in
+#		the loop move to a preheader in front of it
+#	strength reduction: addresses base + s * i + o of an induction
+#		variable i (changed once per iteration by a constant) are kept in
+#		a temp that grows with i, instead of the mul and adds each time
+#
+# the preheader runs even when the loop body does not, so nothing in it
+# may trap unless the header would have (add at its start): pointers are
+# computed with addu
+
+
+# instructions that can run before the loop without changing what the
+# program does: no side effects and no traps (add, sub and neg trap on
+# overflow, div and rem check for 0, loads can be of null, div.s of 0)
+INVARIANT_OPS = {
+	'li', 'li.s', 'la', 'move',
+	'addu', 'mul', 'seq', 'sne', 'slt', 'sle', 'sgt', 'sge', 'and', 'or', 'not',
+	'add.s', 'sub.s', 'mul.s', 'neg.s',
+	'c.eq.s', 'c.ne.s', 'c.lt.s', 'c.le.s', 'c.gt.s', 'c.ge.s',
+	'itod', 'dtoi',
+}
+
+
+class Loop():
+	"""
+	One natural loop of a function's code.
+
+		header:		index of the label that starts the loop
+		indexes:	sorted indexes of the instructions in the loop
+	"""
+
+	def __init__(self, header, indexes):
+		self.header = header
+		self.indexes = indexes
+
+
+def find_loops(code):
+	# innermost loops first
+	blocks = basic_blocks(code)
+	loops = []
+	for header, body in natural_loops(blocks, successors(code, blocks)).items():
+		start = blocks[header][0]
+		if code[start].op != 'label':
+			continue
+		indexes = sorted(i for n in body for i in range(*blocks[n]))
+		loops.append(Loop(start, indexes))
+	loops.sort(key=lambda loop: len(loop.indexes))
+	return loops
+
+
+def hoist_invariants(code, loop, def_counts):
+	# indexes of the instructions of the loop that can move to its preheader
+	defined = Counter(t for i in loop.indexes for t in defs(code[i]))
+
+	# the header runs whenever the loop is entered, so until something
+	# else can happen there its overflow traps would happen anyway
+	# (OVERFLOW_OPS are only moved from there)
+	entered = set()
+	i = loop.header + 1
+	while code[i].op in INVARIANT_OPS or code[i].op in OVERFLOW_OPS:
+		entered.add(i)
+		i += 1
+
+	invariant = set()
+	invariant_temps = set()
+	changed = True
+	while changed:
+		changed = False
+		for i in loop.indexes:
+			instr = code[i]
+			if i in invariant or def_counts[instr.dst] != 1:
+				continue
+			if instr.op not in INVARIANT_OPS and not (instr.op in OVERFLOW_OPS and i in entered):
+				continue
+			if all(defined[t] == 0 or t in invariant_temps for t in instr.uses()):
+				invariant.add(i)
+				invariant_temps.add(instr.dst)
+				changed = True
+	return sorted(invariant)
+
+
+def induction_variables(code, loop, def_counts):
+	# temp -> (index of its only definition in the loop, step)
+	definitions = {}
+	for i in loop.indexes:
+		for t in defs(code[i]):
+			definitions.setdefault(t, []).append(i)
+
+	def step(i, variable):
+		# step when code[i] is variable = variable + constant
+		instr = code[i]
+		if instr.op in ('add', 'sub') and instr.args[0] is variable and isinstance(instr.args[1], int):
+			return instr.args[1] if instr.op == 'add' else -instr.args[1]
+		if instr.op == 'add' and instr.args[1] is variable and isinstance(instr.args[0], int):
+			return instr.args[0]
+		return None
+
+	variables = {}
+	for t, indexes in definitions.items():
+		if t.is_float or len(indexes) != 1:
+			continue
+		i = indexes[0]
+		instr = code[i]
+		if instr.op == 'move' and isinstance(instr.args[0], Temp):
+			# t = t' with t' = t + c, defined once
+			source = definitions.get(instr.args[0])
+			if source and len(source) == 1 and def_counts[instr.args[0]] == 1:
+				c = step(source[0], t)
+				if c is not None:
+					variables[t] = (i, c)
+		else:
+			c = step(i, t)
+			if c is not None:
+				variables[t] = (i, c)
+	return variables
+
+
+def reduce_strength(code, loop, def_counts, function):
+	# returns (preheader code, {index: instructions that replace code[index]})
+	defined = {t for i in loop.indexes for t in defs(code[i])}
+	variables = induction_variables(code, loop, def_counts)
+	if not variables:
+		return [], {}
+
+	preheader = []
+	replace = {}
+	pointers = {}		# (variable, scale, offset, base) -> temp
+	affine = {}		# temp -> (variable, scale, offset, base): temp is base + scale * variable + offset
+
+	def invariant(operand):
+		return isinstance(operand, Temp) and not operand.is_float and operand not in defined
+
+	for i in loop.indexes:
+		instr = code[i]
+		op = instr.op
+		if op == 'label':
+			affine.clear()		# straight line code only
+			continue
+
+		dst = instr.dst
+		if not isinstance(dst, Temp) or dst.is_float:
+			continue
+
+		if dst in variables:
+			# values computed from the old value
+			for t in [t for t, value in affine.items() if value[0] is dst]:
+				del affine[t]
+			continue
+		if def_counts[dst] != 1:
+			continue
+
+		args = instr.args
+		value = None
+		if op == 'move' and args[0] in variables:
+			value = (args[0], 1, 0, None)
+		elif op in ('add', 'sub', 'mul') and len(args) == 2:
+			a, b = args
+			if op != 'sub' and isinstance(a, int):
+				a, b = b, a
+			x = affine.get(a) or (a in variables and (a, 1, 0, None))
+			if x and isinstance(b, int):
+				variable, scale, offset, base = x
+				if op == 'add':
+					value = (variable, scale, offset + b, base)
+				elif op == 'sub':
+					value = (variable, scale, offset - b, base)
+				elif base is None:
+					value = (variable, scale * b, offset * b, None)
+			elif op == 'add' and x and x[3] is None and invariant(b):
+				value = (x[0], x[1], x[2], b)
+			elif op == 'add' and invariant(a):
+				y = affine.get(b)
+				if y and y[3] is None:
+					value = (y[0], y[1], y[2], a)
+
+		if value is None:
+			continue
+		affine[dst] = value
+
+		if value[3] is None:
+			continue
+		# an address: keep it in a temp that follows the variable
+		pointer = pointers.get(value)
+		if pointer is None:
+			variable, scale, offset, base = value
+			pointer = pointers[value] = function.new_temp()
+			scaled = variable
+			if scale != 1:
+				scaled = function.new_temp()
+				preheader.append(Instr('mul', scaled, (variable, scale)))
+			if offset:
+				preheader.append(Instr('addu', pointer, (scaled, offset)))
+				preheader.append(Instr('addu', pointer, (pointer, base)))
+			else:
+				preheader.append(Instr('addu', pointer, (scaled, base)))
+
+			index, step = variables[variable]
+			replace.setdefault(index, [code[index]]).append(Instr('addu', pointer, (pointer, scale * step)))
+		replace[i] = [Instr('move', dst, (pointer,))]
+
+	return preheader, replace
+
+
+def optimize_loop(function, loop):
+	code = function.code
+	def_counts = Counter(t for instr in code for t in defs(instr))
+
+	hoisted = hoist_invariants(code, loop, def_counts)
+	preheader = [code[i] for i in hoisted]
+	replace = {i: [] for i in hoisted}
+
+	sr_preheader, sr_replace = reduce_strength(code, loop, def_counts, function)
+	preheader += sr_preheader
+	replace.update(sr_replace)
+	if not preheader:
+		return False
+
+	# jumps from outside of the loop to its header go to the preheader
+	header_label = code[loop.header].label
+	inside = set(loop.indexes)
+	preheader_label = None
+	for i, instr in enumerate(code):
+		if instr.op in JUMPS and instr.label == header_label and i not in inside:
+			if preheader_label is None:
+				preheader_label = function.new_label('preheader')
+			code[i] = Instr(instr.op, instr.dst, instr.args, preheader_label)
+
+	if preheader_label:
+		preheader.insert(0, Instr('label', label=preheader_label))
+
+	new_code = code[:loop.header] + preheader
+	for i in range(loop.header, len(code)):
+		new_code.extend(replace.get(i, [code[i]]))
+	function.code = new_code
+	return True
+
+
+def optimize_loops(function):
+	# returns True if the code changed
+	changed = False
+	done = set()		# header labels
+	while True:
+		loop = next((loop for loop in find_loops(function.code) if function.code[loop.header].label not in done), None)
+		if loop is None:
+			return changed
+		done.add(function.code[loop.header].label)
+		changed |= optimize_loop(function, loop)
@@ -1,12 +1,45 @@
-import sys, getopt
+import sys, getopt, os
 from collections import namedtuple
+from multiprocessing import Pool
+from pathlib import Path
 import scanner
 import my_parser
 import cgen
+import incremental
+import peephole
+import optimize
 
 help_message = '''
-main.py -i <inputfile> -o <outputfile>
+main.py [-S ir] [--stats <statsfile>] [--incremental] [--peephole <rules>] [-finline-limit=<n>] -i <inputfile> -o <outputfile>
+main.py --check -i <inputfile> [-o <outputfile>]
 main.py -d [-s] [-p] -i <inputfile>
+main.py -b [-j <jobs>] [--incremental] [--peephole <rules>] [-finline-limit=<n>] [-o <outputdir>] <file or directory> ...
+main.py --serve [--socket <socket>]
+
+-S ir :	write the three address code of the program instead of mips
+--stats :	write time and peak memory of each compiler phase, visit counts
+		and instruction counts to <statsfile> as json
+--incremental :	reuse the mips of functions and classes that did not change since
+		an earlier compile (cached in $DECAF_CACHE_DIR/fragments)
+--peephole :	comma separated peephole optimizations of the mips to run, 'all'
+		(default) or 'none'. rules: stack, memory, moves, jumps.
+		--stats reports how many instructions each one removed
+-finline-limit :	functions with at most <n> three address instructions
+		(default 20) and functions called once are inlined, 0 turns
+		inlining off. incremental compiles do not inline
+--check :	only look for syntax and semantic errors, no code is generated.
+		writes the result as json (like the compile server's responses,
+		without "mips") to <outputfile> or stdout, exits with 1 on errors
+
+options for batch mode:
+-b :	compile every given .d file and every .d file under given directories
+-j :	number of worker processes (default: number of cpus)
+-o :	write .s files under this directory instead of next to .d files
+
+options for server mode:
+--serve :	keep the compiler loaded and serve compile requests on a unix socket
+		(client.py is a drop in replacement for main.py -i/-o that uses it)
+--socket :	socket path (default: $DECAF_SOCKET or a per user file in the temp directory)
 
 options for debug mode:
 -s :	run scanner (use with -d)
@@ -14,27 +47,117 @@ options for debug mode:
 '''
 
 def run_scanner(code, output_file):
-	err, tokens = scanner.tokenize(code)
-	for t in tokens:
-		if t.group == "OP_PUNCTUATION" or t.group == "KEYWORD":
+	for t in scanner.scan(code):
+		if t.group == "MISMATCH":
+			output_file.write("UNDEFINED_TOKEN\n")
+		elif t.group == "OP_PUNCTUATION" or t.group == "KEYWORD":
 			output_file.write(t.value+ "\n")
 		else:
 			output_file.write(t.group + " " + t.value + "\n")
-	if err is not None:
-		output_file.write(err + "\n")
 	output_file.close()
 
 
+def batch_targets(paths, outputdir=''):
+	# (input .d file, output .s file) for every file in paths
+	targets = []
+	for path in paths:
+		path = Path(path)
+		if path.is_dir():
+			files = sorted(path.rglob('*.d'))
+			base = path
+		else:
+			files = [path]
+			base = path.parent
+
+		for f in files:
+			out = f.with_suffix('.s')
+			if outputdir:
+				out = Path(outputdir) / f.relative_to(base).with_suffix('.s')
+			targets.append((str(f), str(out)))
+	return targets
+
+
+fragment_cache = None
+peephole_rules = peephole.RULES
+inline_limit = optimize.INLINE_LIMIT
+
+
+def init_batch_worker(incremental_option=False, rules=peephole.RULES, limit=optimize.INLINE_LIMIT):
+	# build the parser once per worker, not once per file
+	global fragment_cache, peephole_rules, inline_limit
+	my_parser.get_parser()
+	if incremental_option:
+		fragment_cache = incremental.FragmentCache()
+	peephole_rules = rules
+	inline_limit = limit
+
+
+def compile_target(target):
+	inputfile, outputfile = target
+	try:
+		with open(inputfile, "r") as input_file:
+			code = input_file.read()
+
+		assembly = cgen.generate_assembly(code, cache=fragment_cache, peephole_rules=peephole_rules, inline_limit=inline_limit)
+
+		os.makedirs(os.path.dirname(outputfile) or '.', exist_ok=True)
+		with open(outputfile, "w") as output_file:
+			assembly.render(output_file)
+	except Exception as e:
+		return (inputfile, f"{type(e).__name__}: {e}")
+
+	return (inputfile, None)
+
+
+def run_batch(paths, outputdir='', jobs=None, incremental_option=False, rules=peephole.RULES, limit=optimize.INLINE_LIMIT):
+	targets = batch_targets(paths, outputdir)
+
+	failed = 0
+	with Pool(jobs, initializer=init_batch_worker, initargs=(incremental_option, rules, limit)) as pool:
+		for inputfile, err in pool.imap_unordered(compile_target, targets):
+			if err:
+				failed += 1
+				print(f"{inputfile}: {err}", file=sys.stderr)
+
+	print(f"compiled {len(targets) - failed}/{len(targets)} files", file=sys.stderr)
+	return 1 if failed else 0
+
+
+def run_check(code, outputfile=''):
+	import json
+	from server import compile_request
+	response = compile_request({'code': code, 'check': True})
+
+	if outputfile:
+		with open(outputfile, "w") as output_file:
+			json.dump(response, output_file)
+	else:
+		print(json.dumps(response))
+	return 0 if response['status'] == 'ok' else 1
+
+
 def main(argv):
 	debug = False 
 	run_scanner_option = False
 	run_parser_option = False
+	batch = False
+	jobs = None
+	serve = False
+	socket_path = None
+	stage = 'mips'
+	stats_file = None
+	incremental_option = False
+	check = False
+	rules = peephole.RULES
+	limit = optimize.INLINE_LIMIT
 
 
 	inputfile = ''
 	outputfile = ''
+	# gcc style -finline-limit=<n>
+	argv = ['-' + arg if arg.startswith('-finline-limit') else arg for arg in argv]
 	try:
-		opts, args = getopt.getopt(argv,"dhpsi:o:",["ifile=","ofile="])
+		opts, args = getopt.getopt(argv,"dhpsbi:o:j:S:",["ifile=","ofile=","batch","jobs=","serve","socket=","stats=","incremental","check","peephole=","finline-limit="])
 	except getopt.GetoptError:
 		print(help_message)
 		sys.exit(2)
@@ -46,6 +169,34 @@ def main(argv):
 			run_scanner_option = True
 		if opt == '-p':
 			run_parser_option = True
+		if opt in ("-b", "--batch"):
+			batch = True
+		if opt in ("-j", "--jobs"):
+			jobs = int(arg)
+		if opt == '--serve':
+			serve = True
+		if opt == '--socket':
+			socket_path = arg
+		if opt == '-S':
+			stage = arg
+		if opt == '--stats':
+			stats_file = arg
+		if opt == '--incremental':
+			incremental_option = True
+		if opt == '--check':
+			check = True
+		if opt == '--finline-limit':
+			try:
+				limit = int(arg)
+			except ValueError:
+				print(f"-finline-limit needs a number, not '{arg}'", file=sys.stderr)
+				sys.exit(2)
+		if opt == '--peephole':
+			try:
+				rules = peephole.parse_rules(arg)
+			except ValueError as err:
+				print(err, file=sys.stderr)
+				sys.exit(2)
 		if opt == '-h':
 			print (help_message)
 			sys.exit()
@@ -54,6 +205,14 @@ def main(argv):
 		elif opt in ("-o", "--ofile"):
 			outputfile = arg
 
+	if serve:
+		import server
+		server.serve(socket_path or server.default_socket_path)
+		return
+
+	if batch:
+		sys.exit(run_batch(args, outputfile, jobs, incremental_option, rules, limit))
+
 	code = ""
 	with open(inputfile, "r") as input_file:
 		code = input_file.read()
@@ -65,8 +224,6 @@ def main(argv):
 			my_parser.debug_main(code)
 		return
 	
-	output_file = open(outputfile, "w")
-
 	# phase1
 	# only_scanner(code, output_file)
 
@@ -77,10 +234,32 @@ def main(argv):
 	# else:
 	# 	output_file.write("Syntax Error")
 
+	if check:
+		sys.exit(run_check(code, outputfile))
+
 	# phase3
-	mips = cgen.generate_tac(code)
-	output_file.write(mips)
+	compile_stats = None
+	if stats_file:
+		from stats import CompileStats
+		compile_stats = CompileStats()
+
+	if stage == 'ir':
+		try:
+			program = cgen.lower(code, compile_stats, limit)
+		except cgen.SemanticError as err:
+			print(err, file=sys.stderr)
+			sys.exit(1)
+		with open(outputfile, "w") as output_file:
+			output_file.write(program.getvalue())
+	else:
+		cache = incremental.FragmentCache() if incremental_option else None
+		assembly = cgen.generate_assembly(code, compile_stats, cache, rules, limit)
+		with open(outputfile, "w") as output_file:
+			assembly.render(output_file)
 
+	if compile_stats:
+		with open(stats_file, "w") as f:
+			compile_stats.write(f)
 
 if __name__ == "__main__":
 	main(sys.argv[1:])
@@ -0,0 +1,660 @@
+from emitter import Emitter, INSTRUCTION
+from tac import Temp
+import regalloc
+import peephole
+
+
+# double compares: tac op -> (mips op, swap operands, value when condition is true)
+DOUBLE_COMPARES = {
+	'c.eq.s': ('c.eq.s', False, 1),
+	'c.ne.s': ('c.eq.s', False, 0),
+	'c.lt.s': ('c.lt.s', False, 1),
+	'c.le.s': ('c.le.s', False, 1),
+	'c.gt.s': ('c.lt.s', True, 1),
+	'c.ge.s': ('c.le.s', True, 1),
+}
+
+# double compare and branch: tac op -> double compare that has to be true
+DOUBLE_BRANCHES = {
+	'beq.s': 'c.eq.s',
+	'bne.s': 'c.ne.s',
+	'blt.s': 'c.lt.s',
+	'ble.s': 'c.le.s',
+	'bgt.s': 'c.gt.s',
+	'bge.s': 'c.ge.s',
+}
+
+INT_BINARY = {'add', 'addu', 'sub', 'mul', 'div', 'rem', 'seq', 'sne', 'slt', 'sle', 'sgt', 'sge', 'and', 'or'}
+DOUBLE_BINARY = {'add.s', 'sub.s', 'mul.s', 'div.s'}
+
+# builtins implemented as runtime functions, arguments in $a0, $a1
+RUNTIME_BUILTINS = {
+	'string_concat': '_string_concat',
+	'string_equal': '_string_equal',
+	'array_concat': '_array_concat',
+	'read_line': '_read_line',
+	'print_bool': 'print_bool',
+}
+
+
+class MipsBackend():
+	"""
+	Turns a tac.Program into mips code (an Emitter).
+
+	Global variables live in static memory ($gp + address), formals in
+	the arguments the caller pushed and locals are temps. Temps live in
+	the registers given by regalloc, spilled temps in the stack frame;
+	their operands are loaded into $t8, $t9 ($f0, $f2).
+	"""
+
+	def __init__(self, program, peephole_rules=peephole.RULES):
+		self.program = program
+		self.peephole_rules = peephole_rules
+		self.peephole_removed = None		# Counter of instructions removed by each rule
+		self.code = Emitter()
+		self.labels = 0
+		self.function_label = None
+		self.allocation = None
+		self.formals_count = 0
+		self.has_frame = True
+		self.slots_offset = 0		# of spilled temp 0 from $fp
+
+
+	def new_label(self):
+		self.labels += 1
+		return f'_{self.function_label}_L_{self.labels}'
+
+
+	def generate(self):
+		return link([self.fragment()])
+
+
+	def fragment(self):
+		# (data, text) of the program's classes, strings and functions
+		data = Emitter()
+		for class_ in self.program.classes:
+			# strings of other fragments may come before
+			data.directive('.align', 2)
+			entries = [label or 0 for label in class_.vtable] or [0]
+			data.directive('.word', *entries, label=class_.vtable_label)
+
+		for label, s in self.program.strings:
+			data.directive('.asciiz', f'"{s}"', label=label)
+
+		self.code = Emitter()
+		for function in self.program.functions:
+			self.function(function)
+
+		self.code.records, self.peephole_removed = peephole.optimize(self.code.records, self.peephole_rules)
+		return data, self.code
+
+
+	def slot(self, temp):
+		return f'{self.slots_offset - self.allocation.slots[temp] * 4}($fp)'
+
+	def address(self, variable):
+		if variable.storage == 'formal':
+			if not self.has_frame:
+				# $sp does not move in functions without a frame (no calls)
+				return f'{(self.formals_count - variable.address) * 4 - 4}($sp)'
+			return f'{(self.formals_count - variable.address) * 4}($fp)'
+		return f'{variable.address}($gp)'
+
+	def src(self, operand, scratch):
+		# register with the value of operand (a Temp or an int)
+		if not isinstance(operand, Temp):
+			if operand == 0:
+				return '$zero'
+			self.code.emit('li', scratch, operand)
+			return scratch
+
+		register = self.allocation.registers.get(operand)
+		if register:
+			return register
+
+		self.code.emit('l.s' if operand.is_float else 'lw', scratch, self.slot(operand))
+		return scratch
+
+	def dst(self, temp, scratch):
+		# register to compute temp in, call store_dst after
+		return self.allocation.registers.get(temp, scratch)
+
+	def store_dst(self, temp, register):
+		if temp not in self.allocation.registers:
+			self.code.emit('s.s' if temp.is_float else 'sw', register, self.slot(temp))
+
+	def move_to(self, register, operand):
+		# operand to a fixed (int) register, e.g. arguments of syscalls
+		if not isinstance(operand, Temp):
+			self.code.emit('li', register, operand)
+		elif operand in self.allocation.registers:
+			self.code.emit('mfc1' if operand.is_float else 'move', register, self.allocation.registers[operand])
+		else:
+			self.code.emit('lw', register, self.slot(operand))
+
+	def move_from(self, temp, register):
+		# value of a fixed (int) register, e.g. $v0, to temp
+		if temp not in self.allocation.registers:
+			self.code.emit('sw', register, self.slot(temp))
+		elif temp.is_float:
+			self.code.emit('mtc1', register, self.allocation.registers[temp])
+		else:
+			self.code.emit('move', self.allocation.registers[temp], register)
+
+	def push(self, operand):
+		self.code.emit('addi', '$sp', '$sp', -4)
+		if operand in self.allocation.registers:
+			self.code.emit('s.s' if operand.is_float else 'sw', self.allocation.registers[operand], '0($sp)')
+		else:
+			self.move_to('$t8', operand)
+			self.code.emit('sw', '$t8', '0($sp)')
+
+
+	def function(self, function):
+
+		# stack frame
+		#			-------------------
+		# 			| 	argument 1    |			\
+		# 			| 		...		  |				=> caller
+		# 			| 	argument n    |			/
+		#			-------------------
+		#  $fp -> 	| 	  old fp	  |			\
+		#  $fp - 4 	| 	  old ra	  |			\
+		#  		 	| saved registers |			\
+		#  			| 		...		  |			 \
+		#			-------------------				=> callee
+		# 			| spilled temp 0  |		   /
+		# 			| 		...		  |		  /
+		#  $sp ->	| spilled temp n  |
+		#			-------------------
+
+		# locals are temps (optimize.promote_variables), only formals are
+		# in memory. ra is only saved by functions that call (jal) and only
+		# the $s registers the function uses are saved. functions that need
+		# neither, nor spilled temps, have no frame at all and find their
+		# arguments from $sp
+
+		# access arguments with $fp + 4 * n, ..., $fp + 4 (the last one)
+
+		# return value in v0
+
+		code = self.code
+		self.function_label = function.label
+		self.labels = 0
+		self.allocation = regalloc.allocate(function.code, clobbers_registers)
+		self.formals_count = len(function.formals)
+
+		used = set(self.allocation.registers.values())
+		is_leaf = not any(clobbers_registers(instr) for instr in function.code)
+		saved = ([] if is_leaf else ['$ra']) + [r for r in regalloc.INT_CALLEE_SAVED if r in used]
+		self.has_frame = bool(saved or self.allocation.slots)
+		self.slots_offset = -4 - len(saved) * 4
+
+		code.comment('Function')
+		code.label(function.label)
+
+		if self.has_frame:
+			# func store registers
+			code.emit('sw', '$fp', '-4($sp)')
+			code.emit('addi', '$fp', '$sp', -4, comment='new frame pointer')
+
+			for i, register in enumerate(saved):
+				code.emit('sw', register, f'{-4 - i * 4}($fp)')
+
+			code.emit('addi', '$sp', '$fp', self.slots_offset + 4 - len(self.allocation.slots) * 4, comment='update stack pointer')
+
+		code.comment('func statement')
+		self.end_label = f'{function.label}_end'
+		for instr in function.code:
+			self.instruction(instr)
+
+		code.label(self.end_label)
+		if self.has_frame:
+			# func load registers
+			for i, register in enumerate(saved):
+				code.emit('lw', register, f'{-4 - i * 4}($fp)')
+
+			code.emit('addi', '$sp', '$fp', 4, comment='update stack pointer to old value')
+			code.emit('lw', '$fp', '0($fp)', comment='old frame pointer')
+		code.emit('jr', '$ra')
+
+
+	def instruction(self, instr):
+		code = self.code
+		op = instr.op
+		dst = instr.dst
+		args = instr.args
+
+		if op == 'label':
+			code.label(instr.label)
+
+		elif op in ('li', 'la', 'li.s'):
+			register = self.dst(dst, '$f0' if op == 'li.s' else '$t8')
+			code.emit(op, register, instr.label if op == 'la' else args[0])
+			self.store_dst(dst, register)
+
+		elif op == 'move':
+			register = self.dst(dst, '$f0' if dst.is_float else '$t8')
+			code.emit('mov.s' if dst.is_float else 'move', register, self.src(args[0], register))
+			self.store_dst(dst, register)
+
+		elif op in INT_BINARY:
+			register = self.dst(dst, '$t8')
+			value1 = self.src(args[0], '$t8')
+			if isinstance(args[1], int) and op in ('add', 'addu') and -2**15 <= args[1] < 2**15:
+				code.emit('addi' if op == 'add' else 'addiu', register, value1, args[1])
+			else:
+				code.emit(op, register, value1, self.src(args[1], '$t9'))
+			self.store_dst(dst, register)
+
+		elif op in ('neg', 'not', 'neg.s'):
+			register = self.dst(dst, '$f0' if dst.is_float else '$t8')
+			value = self.src(args[0], register)
+			if op == 'neg':
+				code.emit('sub', register, '$zero', value)
+			elif op == 'not':
+				code.emit('xori', register, value, 1)
+			else:
+				code.emit('neg.s', register, value)
+			self.store_dst(dst, register)
+
+		elif op in DOUBLE_BINARY:
+			register = self.dst(dst, '$f0')
+			code.emit(op, register, self.src(args[0], '$f0'), self.src(args[1], '$f2'))
+			self.store_dst(dst, register)
+
+		elif op in DOUBLE_COMPARES:
+			compare, swap, true_value = DOUBLE_COMPARES[op]
+			label = self.new_label()
+			operands = [self.src(args[0], '$f0'), self.src(args[1], '$f2')]
+			if swap:
+				operands.reverse()
+			register = self.dst(dst, '$t8')
+			code.emit('li', register, 1 - true_value)
+			code.emit(compare, *operands)
+			code.emit('bc1f', label)
+			code.emit('li', register, true_value)
+			code.label(label)
+			self.store_dst(dst, register)
+
+		elif op == 'itod':
+			register = self.dst(dst, '$f0')
+			code.emit('mtc1', self.src(args[0], '$t8'), '$f2')
+			code.emit('cvt.s.w', register, '$f2')
+			self.store_dst(dst, register)
+
+		elif op == 'dtoi':
+			self.dtoi(args[0], dst)
+
+		elif op == 'load':
+			register = self.dst(dst, '$f0' if dst.is_float else '$t9')
+			code.emit('l.s' if dst.is_float else 'lw', register, f'{args[1]}({self.src(args[0], "$t8")})')
+			self.store_dst(dst, register)
+
+		elif op == 'store':
+			is_float = isinstance(args[0], Temp) and args[0].is_float
+			value = self.src(args[0], '$f0' if is_float else '$t8')
+			code.emit('s.s' if is_float else 'sw', value, f'{args[2]}({self.src(args[1], "$t9")})')
+
+		elif op == 'loadvar':
+			register = self.dst(dst, '$f0' if dst.is_float else '$t8')
+			code.emit('l.s' if dst.is_float else 'lw', register, self.address(args[0]))
+			self.store_dst(dst, register)
+
+		elif op == 'storevar':
+			is_float = isinstance(args[1], Temp) and args[1].is_float
+			value = self.src(args[1], '$f0' if is_float else '$t8')
+			code.emit('s.s' if is_float else 'sw', value, self.address(args[0]))
+
+		elif op == 'goto':
+			code.emit('j', instr.label)
+
+		elif op in ('beqz', 'bnez'):
+			code.emit(op, self.src(args[0], '$t8'), instr.label)
+
+		elif op in ('beq', 'bne', 'blt', 'ble', 'bgt', 'bge'):
+			value1 = self.src(args[0], '$t8')
+			if isinstance(args[1], int):
+				code.emit(op, value1, args[1], instr.label)
+			else:
+				code.emit(op, value1, self.src(args[1], '$t9'), instr.label)
+
+		elif op in DOUBLE_BRANCHES:
+			compare, swap, true_value = DOUBLE_COMPARES[DOUBLE_BRANCHES[op]]
+			operands = [self.src(args[0], '$f0'), self.src(args[1], '$f2')]
+			if swap:
+				operands.reverse()
+			code.emit(compare, *operands)
+			code.emit('bc1t' if true_value else 'bc1f', instr.label)
+
+		elif op == 'call':
+			for arg in args:
+				self.push(arg)
+			code.emit('jal', instr.label)
+			code.emit('addi', '$sp', '$sp', len(args) * 4)
+			if dst is not None:
+				self.move_from(dst, '$v0')
+
+		elif op == 'callr':
+			for arg in args[1:]:
+				self.push(arg)
+			code.emit('jalr', self.src(args[0], '$t9'))
+			code.emit('addi', '$sp', '$sp', (len(args) - 1) * 4)
+			if dst is not None:
+				self.move_from(dst, '$v0')
+
+		elif op == 'return':
+			if args:
+				self.move_to('$v0', args[0])
+			code.emit('j', self.end_label)
+
+		elif op == 'builtin':
+			self.builtin(instr.label, dst, args)
+
+		else:
+			raise ValueError(f"unknown tac op '{op}'")
+
+
+	def dtoi(self, value, dst):
+		# round half away from zero, -0.5 -> 0
+		code = self.code
+		label = self.new_label()
+		half_label = self.new_label()
+		end_label = self.new_label()
+		value = self.src(value, '$f0')
+		register = self.dst(dst, '$t8')
+		code.emit('li.s', '$f2', '-0.5')
+		code.emit('c.eq.s', value, '$f2')
+		code.emit('bc1t', half_label)
+		code.emit('li.s', '$f2', '0.0')
+		code.emit('c.lt.s', value, '$f2')
+		code.emit('li.s', '$f2', '-0.5')
+		code.emit('bc1t', label)
+		code.emit('li.s', '$f2', '0.5')
+		code.label(label)
+		code.emit('add.s', '$f2', value, '$f2')
+		code.emit('cvt.w.s', '$f2', '$f2')
+		code.emit('mfc1', register, '$f2')
+		code.emit('j', end_label)
+		code.label(half_label)
+		code.emit('move', register, '$zero')
+		code.label(end_label)
+		self.store_dst(dst, register)
+
+
+	def builtin(self, name, dst, args):
+		code = self.code
+
+		if name == 'print_int':
+			self.move_to('$a0', args[0])
+			code.emit('li', '$v0', 1, comment='syscall for print integer')
+			code.emit('syscall')
+
+		elif name == 'print_double':
+			value = self.src(args[0], '$f12')
+			if value != '$f12':
+				code.emit('mov.s', '$f12', value)
+			code.emit('li', '$v0', 2, comment='syscall for print double')
+			code.emit('syscall')
+
+		elif name == 'print_string':
+			self.move_to('$a0', args[0])
+			code.emit('li', '$v0', 4, comment='syscall for print string')
+			code.emit('syscall')
+
+		elif name == 'print_newline':
+			code.emit('la', '$a0', 'newLineStr')
+			code.emit('li', '$v0', 4, comment='syscall for print string')
+			code.emit('syscall')
+
+		elif name == 'read_int':
+			code.emit('li', '$v0', 5, comment='syscall for read integer')
+			code.emit('syscall')
+			self.move_from(dst, '$v0')
+
+		elif name == 'alloc':
+			self.move_to('$a0', args[0])
+			code.emit('li', '$v0', 9, comment='syscall for allocate bytes')
+			code.emit('syscall')
+			self.move_from(dst, '$v0')
+
+		else:
+			for reg, arg in zip(('$a0', '$a1'), args):
+				self.move_to(reg, arg)
+			code.emit('jal', RUNTIME_BUILTINS[name])
+			if dst is not None:
+				self.move_from(dst, '$v0')
+
+
+def clobbers_registers(instr):
+	# calls of functions and of runtime functions change $t and $f registers
+	return instr.op in ('call', 'callr') or instr.op == 'builtin' and instr.label in RUNTIME_BUILTINS
+
+
+def link(fragments):
+	# whole program from (data, text) fragments
+	code = Emitter()
+	code.directive('.text')
+
+	for fragment_data, fragment_code in fragments:
+		code.extend(fragment_code)
+
+	# add main
+	code.label('main')
+	code.emit('jal', 'func_main')
+
+	code.comment('exit')
+	code.emit('li', '$v0', 10)
+	code.emit('syscall')
+
+	# add the runtime functions the program uses
+	used = referenced_labels(code)
+	for label, runtime_function in RUNTIME_FUNCTIONS.items():
+		if label in used:
+			runtime_function(code)
+	used |= referenced_labels(code)
+
+	data = Emitter()
+	data.directive('.data')
+	for label, value in RUNTIME_STRINGS.items():
+		if label in used:
+			data.directive('.asciiz', value, label=label)
+
+	for fragment_data, fragment_code in fragments:
+		data.extend(fragment_data)
+
+	data.extend(code)
+	return data
+
+
+def referenced_labels(code):
+	# operands of instructions, labels among them
+	return {arg for kind, op, args, comment in code.records if kind == INSTRUCTION for arg in args if isinstance(arg, str)}
+
+
+RUNTIME_STRINGS = {
+	'runtimeErrorStr': '"oh no runtime error"',
+	'falseStr': '"false"',
+	'trueStr': '"true"',
+	'newLineStr': '"\\n"',
+}
+
+
+# runtime functions only use $t, $a and $v registers
+
+def print_bool(code):
+	code.comment('Function: Print_bool(a0: boolean_value)')
+	code.label('print_bool')
+	code.emit('beq', '$a0', '$zero', 'print_bool_false')
+	code.emit('la', '$a0', 'trueStr')
+	code.emit('b', 'print_bool_end')
+
+	code.label('print_bool_false')
+	code.emit('la', '$a0', 'falseStr')
+
+	code.label('print_bool_end')
+	code.emit('li', '$v0', 4, comment='sys call for print string')
+	code.emit('syscall')
+	code.emit('jr', '$ra')
+
+
+def string_concat(code):
+	code.comment('Function: String_concat(a0: string1, a1: string2) $v0: new string')
+	code.label('_string_concat')
+	code.emit('li', '$t0', 1, comment='t0: length(op1) + length(op2) + 1(for null termination)')
+	code.emit('move', '$t1', '$a0')
+	code.label('_string_concat_length1')
+	code.emit('lb', '$t2', '0($t1)')
+	code.emit('beq', '$t2', '$zero', '_string_concat_length2_begin')
+	code.emit('addi', '$t0', '$t0', 1)
+	code.emit('addi', '$t1', '$t1', 1)
+	code.emit('b', '_string_concat_length1')
+
+	code.label('_string_concat_length2_begin')
+	code.emit('move', '$t1', '$a1')
+	code.label('_string_concat_length2')
+	code.emit('lb', '$t2', '0($t1)')
+	code.emit('beq', '$t2', '$zero', '_string_concat_allocate')
+	code.emit('addi', '$t0', '$t0', 1)
+	code.emit('addi', '$t1', '$t1', 1)
+	code.emit('b', '_string_concat_length2')
+
+	code.label('_string_concat_allocate')
+	code.emit('move', '$t4', '$a0')
+	code.emit('move', '$a0', '$t0')
+	code.emit('li', '$v0', 9, comment='syscall for allocate byte')
+	code.emit('syscall')
+	code.emit('move', '$t3', '$v0', comment='t3: end of new string')
+
+	code.label('_string_concat_op1')
+	code.emit('lb', '$t2', '0($t4)')
+	code.emit('beq', '$t2', '$zero', '_string_concat_op2')
+	code.emit('sb', '$t2', '0($t3)')
+	code.emit('addi', '$t4', '$t4', 1)
+	code.emit('addi', '$t3', '$t3', 1)
+	code.emit('b', '_string_concat_op1')
+
+	code.label('_string_concat_op2')
+	code.emit('lb', '$t2', '0($a1)')
+	code.emit('sb', '$t2', '0($t3)')
+	code.emit('beq', '$t2', '$zero', '_string_concat_end')
+	code.emit('addi', '$a1', '$a1', 1)
+	code.emit('addi', '$t3', '$t3', 1)
+	code.emit('b', '_string_concat_op2')
+
+	code.label('_string_concat_end')
+	code.emit('jr', '$ra')
+
+
+def string_equal(code):
+	code.comment('Function: String_equal(a0: string1, a1: string2) $v0: 1 if equal')
+	code.label('_string_equal')
+	code.emit('lb', '$t2', '0($a0)')
+	code.emit('lb', '$t3', '0($a1)')
+	code.emit('bne', '$t2', '$t3', '_string_equal_ne')
+	code.emit('beq', '$t2', '$zero', '_string_equal_eq')
+	code.emit('addi', '$a0', '$a0', 1)
+	code.emit('addi', '$a1', '$a1', 1)
+	code.emit('j', '_string_equal')
+
+	code.label('_string_equal_ne')
+	code.emit('li', '$v0', 0)
+	code.emit('jr', '$ra')
+
+	code.label('_string_equal_eq')
+	code.emit('li', '$v0', 1)
+	code.emit('jr', '$ra')
+
+
+def array_concat(code):
+	code.comment('Function: Array_concat(a0: array1, a1: array2) $v0: new array')
+	code.label('_array_concat')
+	code.emit('lw', '$t3', '0($a0)', comment='t3: length of array 1')
+	code.emit('lw', '$t4', '0($a1)', comment='t4: length of array 2')
+	code.emit('add', '$t1', '$t3', '$t4')
+	code.emit('addi', '$t0', '$t1', 1, comment='t0: length(arr1) + length(arr2) + 1(for size)')
+	code.emit('mul', '$t0', '$t0', 4)
+
+	code.emit('move', '$t5', '$a0')
+	code.emit('move', '$a0', '$t0')
+	code.emit('li', '$v0', 9, comment='syscall for allocate byte')
+	code.emit('syscall')
+
+	code.emit('sw', '$t1', '0($v0)', comment='store size in first word')
+
+	code.emit('addi', '$t5', '$t5', 4)
+	code.emit('addi', '$t6', '$v0', 4)
+	code.emit('addi', '$a1', '$a1', 4)
+
+	code.label('_array_concat_op1')
+	code.emit('lw', '$t1', '0($t5)')
+	code.emit('sw', '$t1', '0($t6)')
+	code.emit('addi', '$t3', '$t3', -1)
+	code.emit('beq', '$t3', '$zero', '_array_concat_change')
+	code.emit('addi', '$t5', '$t5', 4)
+	code.emit('addi', '$t6', '$t6', 4)
+	code.emit('j', '_array_concat_op1')
+
+	code.label('_array_concat_change')
+	code.emit('addi', '$t6', '$t6', 4)
+
+	code.label('_array_concat_op2')
+	code.emit('lw', '$t1', '0($a1)')
+	code.emit('sw', '$t1', '0($t6)')
+	code.emit('addi', '$t4', '$t4', -1)
+	code.emit('beq', '$t4', '$zero', '_array_concat_end')
+	code.emit('addi', '$a1', '$a1', 4)
+	code.emit('addi', '$t6', '$t6', 4)
+	code.emit('j', '_array_concat_op2')
+
+	code.label('_array_concat_end')
+	code.emit('jr', '$ra')
+
+
+def read_line(code):
+	code.comment('Function: Read_line() $v0: line without new line')
+	code.label('_read_line')
+	code.emit('li', '$v0', 9, comment='syscall for allocating bytes')
+	code.emit('li', '$a0', 1000)
+	code.emit('syscall')
+	code.emit('move', '$t1', '$v0', comment='t1: line')
+	code.emit('move', '$a0', '$v0')
+	code.emit('li', '$a1', 1000)
+	code.emit('li', '$v0', 8, comment='syscall for read string')
+	code.emit('syscall')
+	code.emit('move', '$v0', '$t1')
+
+	code.label('_read_line_loop')
+	code.emit('lb', '$t0', '0($t1)')
+	code.emit('beq', '$t0', 0, '_read_line_end')
+	code.emit('beq', '$t0', 10, '_read_line_remove')
+	code.emit('bne', '$t0', 13, '_read_line_next')
+	code.label('_read_line_remove')
+	code.emit('sb', '$zero', '0($t1)')
+	code.label('_read_line_next')
+	code.emit('addi', '$t1', '$t1', 1)
+	code.emit('j', '_read_line_loop')
+
+	code.label('_read_line_end')
+	code.emit('jr', '$ra')
+
+
+def runtime_error(code):
+	code.label('runtimeError')
+	code.emit('la', '$a0', 'runtimeErrorStr')
+	code.emit('li', '$v0', 4, comment='sys call for print string')
+	code.emit('syscall')
+
+	code.emit('li', '$v0', 10)
+	code.emit('syscall')
+
+
+# label -> function that emits it
+RUNTIME_FUNCTIONS = {
+	'print_bool': print_bool,
+	'_string_concat': string_concat,
+	'_string_equal': string_equal,
+	'_array_concat': array_concat,
+	'_read_line': read_line,
+	'runtimeError': runtime_error,
+}
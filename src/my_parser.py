@@ -1,19 +1,81 @@
 import logging
-from lark import Lark, logger, __file__ as lark_file, ParseError
+import hashlib
+import os
+import tempfile
+from lark import Lark, logger, __file__ as lark_file, __version__ as lark_version, ParseError
 
 logger.setLevel(logging.DEBUG)
 
 from pathlib import Path
 
+import scanner
+
 grammer_path = Path(__file__).parent
 grammer_file = grammer_path / 'grammer.lark'
 
-parser = Lark.open(grammer_file, rel_to=__file__, parser="lalr")
+# built parser tables are stored here, next to python's own bytecode cache
+cache_path = Path(os.environ.get('DECAF_CACHE_DIR', grammer_path / '__pycache__'))
+
+parser_options = {
+    'parser': 'lalr',
+    'propagate_positions': True,
+    'lexer': scanner.LarkLexer,
+}
+
+_parser = None
+
+
+def cache_file():
+    # key: grammar text + lark version + parser options.
+    # changing any of them gives a new file name, so stale tables are never loaded
+    h = hashlib.sha256()
+    h.update(grammer_file.read_bytes())
+    h.update(lark_version.encode())
+    h.update(repr(sorted(parser_options.items())).encode())
+    return cache_path / f'grammer.{h.hexdigest()[:16]}.lark-cache'
+
+
+def build_parser():
+    return Lark.open(grammer_file, rel_to=__file__, **parser_options)
+
+
+def load_parser():
+    fn = cache_file()
+
+    try:
+        with open(fn, 'rb') as f:
+            return Lark.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # corrupt or incompatible cache file, rebuild it
+        logger.debug('Ignoring parser cache %s: %s', fn, e)
+
+    parser = build_parser()
+
+    # write to a temp file and rename, so concurrent compilers never read half a file
+    try:
+        cache_path.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            parser.save(f)
+        os.replace(tmp, fn)
+    except OSError as e:
+        logger.debug('Could not write parser cache %s: %s', fn, e)
+
+    return parser
+
+
+def get_parser():
+    global _parser
+    if _parser is None:
+        _parser = load_parser()
+    return _parser
 
 
 def parse(code):
     try:
-        parser.parse(code)
+        get_parser().parse(code)
         return True
     except ParseError:
         return False
@@ -23,6 +85,6 @@ def debug_main(code):
     print("\n:::PARSER:::")
     print("~~~~~input:")
     print(code)
-    tree = parser.parse(code)
+    tree = get_parser().parse(code)
     print(tree.pretty())
     print(type(tree))
@@ -0,0 +1,627 @@
+import math
+import operator
+import struct
+
+from flow import basic_blocks, label_blocks, defs
+from loops import optimize_loops
+from tac import Temp, Instr, BRANCHES, DOUBLE_BRANCHES, OVERFLOW_OPS
+
+
+# optimizations of tac.Program, run between Cgen and the mips backend
+#
+# constant values are python ints (ints, bools, pointers), floats (doubles,
+# rounded to single precision like on mips) and strs (string constants)
+
+
+VARYING = object()		# not a constant
+
+
+def s32(x):
+	x &= 0xffffffff
+	return x - (1 << 32) if x & 0x80000000 else x
+
+def i32(x):
+	# None on overflow: mips add, addi and sub trap instead of wrapping
+	return x if -2**31 <= x < 2**31 else None
+
+def f32(x):
+	# None when x is not a finite single precision number
+	try:
+		x = struct.unpack('f', struct.pack('f', x))[0]
+	except OverflowError:
+		return None
+	return x if math.isfinite(x) else None
+
+def div(a, b):
+	# mips div: rounds towards zero
+	if b == 0 or (a == -2**31 and b == -1):
+		return None
+	q = abs(a) // abs(b)
+	return q if (a < 0) == (b < 0) else -q
+
+def rem(a, b):
+	q = div(a, b)
+	return None if q is None else a - b * q
+
+def dtoi(x):
+	# like MipsBackend.dtoi: round half away from zero, -0.5 -> 0
+	if x == -0.5:
+		return 0
+	x = f32(x + (-0.5 if x < 0 else 0.5))
+	if x is None or not -2**31 <= x < 2**31:
+		return None
+	return int(x)
+
+
+INT_OPS = {
+	'add': lambda a, b: i32(a + b),
+	'addu': lambda a, b: s32(a + b),
+	'sub': lambda a, b: i32(a - b),
+	'mul': lambda a, b: s32(a * b),
+	'div': div,
+	'rem': rem,
+	'seq': lambda a, b: int(a == b),
+	'sne': lambda a, b: int(a != b),
+	'slt': lambda a, b: int(a < b),
+	'sle': lambda a, b: int(a <= b),
+	'sgt': lambda a, b: int(a > b),
+	'sge': lambda a, b: int(a >= b),
+	'and': operator.and_,
+	'or': operator.or_,
+	'neg': lambda a: i32(-a),
+	'not': lambda a: a ^ 1,
+	'itod': lambda a: f32(float(a)),
+}
+
+DOUBLE_OPS = {
+	'add.s': lambda a, b: f32(a + b),
+	'sub.s': lambda a, b: f32(a - b),
+	'mul.s': lambda a, b: f32(a * b),
+	'div.s': lambda a, b: f32(a / b) if b else None,
+	'neg.s': lambda a: -a,
+	'c.eq.s': lambda a, b: int(a == b),
+	'c.ne.s': lambda a, b: int(a != b),
+	'c.lt.s': lambda a, b: int(a < b),
+	'c.le.s': lambda a, b: int(a <= b),
+	'c.gt.s': lambda a, b: int(a > b),
+	'c.ge.s': lambda a, b: int(a >= b),
+	'dtoi': dtoi,
+}
+
+STRING_BUILTINS = {
+	# escapes are only compared as text when there are none
+	'string_equal': lambda a, b: int(a == b) if '\\' not in a + b else None,
+	'string_concat': operator.add,
+}
+
+BRANCH_TESTS = {
+	'beqz': lambda a: a == 0,
+	'bnez': lambda a: a != 0,
+	'beq': operator.eq,
+	'bne': operator.ne,
+	'blt': operator.lt,
+	'ble': operator.le,
+	'bgt': operator.gt,
+	'bge': operator.ge,
+	'beq.s': operator.eq,
+	'bne.s': operator.ne,
+	'blt.s': operator.lt,
+	'ble.s': operator.le,
+	'bgt.s': operator.gt,
+	'bge.s': operator.ge,
+}
+
+# instructions without side effects, removed when their result is not used
+PURE = {'li', 'li.s', 'la', 'move', 'load', 'loadvar', *INT_OPS, *DOUBLE_OPS}
+PURE_BUILTINS = {'alloc', 'string_equal', 'string_concat', 'array_concat'}
+
+
+def same(a, b):
+	if type(a) is not type(b):
+		return False
+	if isinstance(a, float):
+		return struct.pack('f', a) == struct.pack('f', b)		# 0.0 is not -0.0
+	return a == b
+
+
+def is_int(value):
+	return type(value) is int
+
+def is_double(value):
+	return type(value) is float
+
+def is_string(value):
+	return type(value) is str
+
+
+class ConstantFolder():
+	"""
+	Constant folding and propagation for one function (sparse
+	conditional constant propagation over basic blocks).
+
+	Values of temps (locals too, after promote_variables) are propagated
+	along the edges that can be taken: a branch with a constant condition
+	has one successor, so code behind it is never reached and is removed.
+	Instructions with a constant result become li/li.s/la, int constants
+	used as operands become immediates, and dead definitions are removed.
+	"""
+
+	def __init__(self, function, program):
+		self.function = function
+		self.program = program
+		self.code = function.code
+		self.blocks = basic_blocks(self.code)
+		self.block_of_label = label_blocks(self.code, self.blocks)
+
+		self.string_labels = {}		# label -> str
+		self.labels_of_strings = {}		# str -> label
+		for label, string in program.strings:
+			self.string_labels[label] = string
+			self.labels_of_strings.setdefault(string, label)
+
+		# temps that are used in another block than where they are defined,
+		# others are not propagated
+		self.shared = set()
+		block_of_temp = {}
+		for n, (start, end) in enumerate(self.blocks):
+			for instr in self.code[start:end]:
+				for t in instr.uses():
+					if block_of_temp.get(t, n) != n:
+						self.shared.add(t)
+				for t in defs(instr):
+					if t in block_of_temp and block_of_temp[t] != n:
+						self.shared.add(t)
+					block_of_temp[t] = n
+
+
+	def value(self, operand, env, temps):
+		if isinstance(operand, Temp):
+			if operand in temps:
+				return temps[operand]
+			return env.get(operand, VARYING)
+		if isinstance(operand, int):
+			return operand
+		return VARYING
+
+	def evaluate(self, instr, env, temps):
+		op = instr.op
+		if op == 'li':
+			return instr.args[0]
+		if op == 'li.s':
+			value = f32(float(instr.args[0]))
+			return VARYING if value is None else value
+		if op == 'la':
+			return self.string_labels.get(instr.label, VARYING)
+
+		if op == 'builtin':
+			fold = STRING_BUILTINS.get(instr.label)
+			check = is_string
+		elif op in INT_OPS:
+			fold = INT_OPS[op]
+			check = is_int
+		elif op in DOUBLE_OPS:
+			fold = DOUBLE_OPS[op]
+			check = is_double
+		elif op == 'move':
+			return self.value(instr.args[0], env, temps)
+		else:
+			return VARYING
+
+		if fold is None:
+			return VARYING
+		values = [self.value(arg, env, temps) for arg in instr.args]
+		if not all(check(value) for value in values):
+			return VARYING
+
+		result = fold(*values)
+		return VARYING if result is None else result
+
+	def transfer(self, instr, env, temps):
+		# env: shared temps, temps: temps of the block
+		for t in defs(instr):
+			value = self.evaluate(instr, env, temps)
+			if t in self.shared:
+				env[t] = value
+			else:
+				temps[t] = value
+
+	def branch_taken(self, instr, env, temps):
+		# True or False when the branch has a constant condition, else None
+		check = is_double if instr.op in DOUBLE_BRANCHES else is_int
+		values = [self.value(arg, env, temps) for arg in instr.args]
+		if not all(check(value) for value in values):
+			return None
+		return BRANCH_TESTS[instr.op](*values)
+
+	def successors(self, n, env, temps):
+		# blocks reached from block n
+		start, end = self.blocks[n]
+		last = self.code[end - 1]
+		fall_through = [n + 1] if n + 1 < len(self.blocks) else []
+		target = [self.block_of_label[last.label]] if last.label in self.block_of_label else []
+
+		if last.op == 'goto':
+			return target
+		if last.op == 'return':
+			return []
+		if last.op in BRANCHES:
+			taken = self.branch_taken(last, env, temps)
+			if taken is None:
+				return target + fall_through
+			return target if taken else fall_through
+		return fall_through
+
+
+	def propagate(self):
+		# values at the start of the reached blocks
+		entry = [None] * len(self.blocks)
+		if not self.blocks:
+			return entry
+
+		entry[0] = {}
+		worklist = [0]
+		while worklist:
+			n = worklist.pop()
+			env = dict(entry[n])
+			temps = {}
+			start, end = self.blocks[n]
+			for instr in self.code[start:end]:
+				self.transfer(instr, env, temps)
+
+			for s in self.successors(n, env, temps):
+				if self.merge(entry, s, env):
+					worklist.append(s)
+		return entry
+
+	def merge(self, entry, n, env):
+		# meet of env into the values at the start of block n, True if changed
+		old = entry[n]
+		if old is None:
+			entry[n] = dict(env)
+			return True
+
+		changed = False
+		for key, value in env.items():
+			if key not in old:
+				old[key] = value
+				changed = True
+			elif old[key] is not VARYING and (value is VARYING or not same(old[key], value)):
+				old[key] = VARYING
+				changed = True
+		return changed
+
+
+	def constant(self, dst, value):
+		if is_int(value):
+			return Instr('li', dst, (value,))
+		if is_double(value):
+			return Instr('li.s', dst, (float_text(value),))
+
+		label = self.labels_of_strings.get(value)
+		if label is None:
+			label = self.function.new_label('str')
+			self.program.strings.append((label, value))
+			self.labels_of_strings[value] = label
+			self.string_labels[label] = value
+		return Instr('la', dst, label=label)
+
+	def rewrite(self, entry):
+		code = []
+		for n, (start, end) in enumerate(self.blocks):
+			if entry[n] is None:
+				continue		# never reached
+
+			env = dict(entry[n])
+			temps = {}
+			for instr in self.code[start:end]:
+				if instr.op in BRANCHES:
+					taken = self.branch_taken(instr, env, temps)
+					if taken is True:
+						instr = Instr('goto', label=instr.label)
+					elif taken is False:
+						continue
+
+				args = tuple(self.immediate(arg, env, temps) for arg in instr.args)
+				self.transfer(instr, env, temps)
+
+				if instr.dst is not None and instr.op not in ('li', 'li.s'):
+					value = self.value(instr.dst, env, temps)
+					if value is not VARYING and (instr.op in PURE or instr.op == 'builtin' and instr.label in STRING_BUILTINS):
+						code.append(self.constant(instr.dst, value))
+						continue
+
+				if args != instr.args:
+					instr = Instr(instr.op, instr.dst, args, instr.label)
+				code.append(instr)
+		return code
+
+	def immediate(self, arg, env, temps):
+		# int constant temps are replaced by their value
+		if isinstance(arg, Temp) and not arg.is_float:
+			value = self.value(arg, env, temps)
+			if is_int(value):
+				return value
+		return arg
+
+	def run(self):
+		self.function.code = remove_dead_code(self.rewrite(self.propagate()))
+
+
+def float_text(value):
+	# li.s operand that is exactly value
+	text = repr(value)
+	mantissa, e, exponent = text.partition('e')
+	if e and '.' not in mantissa:
+		text = f'{mantissa}.0e{exponent}'
+	return text
+
+
+def remove_dead_code(code):
+	# removes definitions of temps that are not used, until there are none
+	while True:
+		used = set()
+		for instr in code:
+			used.update(instr.uses())
+
+		def is_dead(instr):
+			if isinstance(instr.dst, Temp) and instr.dst not in used:
+				if instr.op in OVERFLOW_OPS:
+					# the overflow trap has to happen even if the result is not used
+					return all(is_int(arg) for arg in instr.args) and INT_OPS[instr.op](*instr.args) is not None
+				return instr.op in PURE or instr.op == 'builtin' and instr.label in PURE_BUILTINS
+			return False
+
+		live_code = [instr for instr in code if not is_dead(instr)]
+		if len(live_code) == len(code):
+			return code
+		code = live_code
+
+
+def copy(dst, src):
+	# move of src (a temp or an int) to temp dst
+	if dst.is_float and not isinstance(src, Temp):
+		return Instr('li.s', dst, (float_text(float(src)),))		# locals start as 0
+	return Instr('move', dst, (src,))
+
+
+def promote_variables(function):
+	# formals and locals of the function live in temps (registers when
+	# there are enough), loadvar and storevar of them become moves.
+	# formals are loaded once at the start, the backend only reads them
+	# from the caller's arguments there (locals have no place in memory)
+	temps = {}
+	def temp(variable):
+		if variable not in temps:
+			temps[variable] = function.new_temp(variable.type_.name == 'double')
+		return temps[variable]
+
+	code = []
+	for instr in function.code:
+		if instr.op == 'loadvar' and instr.args[0].storage != 'global':
+			code.append(copy(instr.dst, temp(instr.args[0])))
+		elif instr.op == 'storevar' and instr.args[0].storage != 'global':
+			code.append(copy(temp(instr.args[0]), instr.args[1]))
+		else:
+			code.append(instr)
+
+	entry = [Instr('loadvar', temps[formal], (formal,)) for formal in function.formals if formal in temps]
+	function.code = entry + code
+
+
+def propagate_copies(code):
+	# after t = move x, t is replaced by x until one of them changes
+	# (in straight line code, a label ends it)
+	copies = {}		# t -> x
+	copied = {}		# x -> set of t
+	def forget(temp):
+		if temp in copies:
+			copied[copies.pop(temp)].discard(temp)
+		for t in copied.pop(temp, ()):
+			del copies[t]
+
+	out = []
+	for instr in code:
+		if instr.op == 'label':
+			copies.clear()
+			copied.clear()
+			out.append(instr)
+			continue
+
+		args = tuple(copies.get(arg, arg) if isinstance(arg, Temp) else arg for arg in instr.args)
+		if args != instr.args:
+			instr = Instr(instr.op, instr.dst, args, instr.label)
+
+		dst = instr.dst
+		if isinstance(dst, Temp):
+			forget(dst)
+			if instr.op == 'move' and isinstance(args[0], Temp) and args[0] is not dst:
+				copies[dst] = args[0]
+				copied.setdefault(args[0], set()).add(dst)
+		out.append(instr)
+	return out
+
+
+def fold_constants(program, functions=None):
+	for function in program.functions if functions is None else functions:
+		ConstantFolder(function, program).run()
+
+
+def remove_unreachable(program, entry='func_main'):
+	# keeps the functions reached from entry through calls and the vtables
+	# of classes that are instantiated, the classes and strings they use,
+	# and stores to globals that are loaded somewhere
+	functions = {function.label: function for function in program.functions}
+	classes = {class_.vtable_label: class_ for class_ in program.classes}
+	if entry not in functions:
+		return
+
+	reached = {entry}
+	worklist = [entry]
+	labels = set()		# labels used by the reached functions
+	loaded = set()		# globals
+	while worklist:
+		function = functions[worklist.pop()]
+		for instr in function.code:
+			if instr.op == 'loadvar' and instr.args[0].storage == 'global':
+				loaded.add(instr.args[0])
+			if instr.op not in ('call', 'la') or instr.label in labels:
+				continue
+
+			labels.add(instr.label)
+			targets = [instr.label]
+			if instr.label in classes:		# new
+				targets = classes[instr.label].vtable
+			for label in targets:
+				if label in functions and label not in reached:
+					reached.add(label)
+					worklist.append(label)
+
+	program.functions = [function for function in program.functions if function.label in reached]
+	program.classes = [class_ for class_ in program.classes if class_.vtable_label in labels]
+	program.strings = [(label, string) for label, string in program.strings if label in labels]
+
+	for function in program.functions:
+		code = [instr for instr in function.code if not (instr.op == 'storevar' and instr.args[0].storage == 'global' and instr.args[0] not in loaded)]
+		if len(code) != len(function.code):
+			function.code = remove_dead_code(code)
+
+
+# instructions of the functions inline_calls copies to every call
+INLINE_LIMIT = 20
+
+
+def calls(function, functions):
+	# labels of the functions in functions that function calls
+	return [instr.label for instr in function.code if instr.op == 'call' and instr.label in functions]
+
+def recursive_functions(functions):
+	# labels of the functions that can call themselves
+	callees = {label: set(calls(function, functions)) for label, function in functions.items()}
+	recursive = set()
+	for label in functions:
+		seen = set()
+		worklist = list(callees[label])
+		while worklist:
+			callee = worklist.pop()
+			if callee == label:
+				recursive.add(label)
+				break
+			if callee not in seen:
+				seen.add(callee)
+				worklist.extend(callees[callee])
+	return recursive
+
+def bottom_up(functions):
+	# labels of functions, callees before their callers
+	order = []
+	visited = set()
+	for root in functions:
+		if root in visited:
+			continue
+		visited.add(root)
+		stack = [(root, iter(calls(functions[root], functions)))]
+		while stack:
+			label, callees = stack[-1]
+			for callee in callees:
+				if callee not in visited:
+					visited.add(callee)
+					stack.append((callee, iter(calls(functions[callee], functions))))
+					break
+			else:
+				stack.pop()
+				order.append(label)
+	return order
+
+
+def inline(caller, callee, call):
+	# code of callee (after promote_variables) for the call instruction in
+	# caller: formals become temps of caller, returns jump to the end
+	temps = {}		# callee temps and formals -> caller temps
+	def temp(operand):
+		if operand not in temps:
+			if isinstance(operand, Temp):
+				temps[operand] = caller.new_temp(operand.is_float)
+			else:
+				temps[operand] = caller.new_temp(operand.type_.name == 'double')
+		return temps[operand]
+
+	def operand(arg):
+		return temp(arg) if isinstance(arg, Temp) else arg
+
+	labels = {instr.label: caller.new_label('inline') for instr in callee.code if instr.op == 'label'}
+	end_label = caller.new_label('end_inline')
+
+	code = [copy(temp(formal), arg) for formal, arg in zip(callee.formals, call.args)]
+	for instr in callee.code:
+		op = instr.op
+		if op == 'loadvar' and instr.args[0].storage == 'formal':
+			code.append(copy(temp(instr.dst), temp(instr.args[0])))
+		elif op == 'return':
+			if instr.args and call.dst is not None:
+				code.append(copy(call.dst, operand(instr.args[0])))
+			code.append(Instr('goto', label=end_label))
+		else:
+			dst = temp(instr.dst) if isinstance(instr.dst, Temp) else instr.dst
+			args = tuple(operand(arg) for arg in instr.args)
+			code.append(Instr(op, dst, args, labels.get(instr.label, instr.label)))
+
+	code.append(Instr('label', label=end_label))
+	return code
+
+
+def inline_calls(program, limit=INLINE_LIMIT):
+	# replaces calls of small functions (at most limit instructions) and of
+	# functions that are called once by their code, callees first so their
+	# own calls are already inlined. returns the functions that changed
+	if limit <= 0:
+		return []
+
+	functions = {function.label: function for function in program.functions}
+	recursive = recursive_functions(functions)
+	calls_count = {}
+	for function in program.functions:
+		for label in calls(function, functions):
+			calls_count[label] = calls_count.get(label, 0) + 1
+
+	def size(function):
+		return sum(1 for instr in function.code if instr.op != 'label')
+
+	changed = []
+	for label in bottom_up(functions):
+		function = functions[label]
+		code = []
+		for instr in function.code:
+			callee = functions.get(instr.label) if instr.op == 'call' else None
+			if callee is None or callee.label in recursive or\
+			 size(callee) > limit and calls_count[callee.label] > 1:
+				code.append(instr)
+				continue
+			code.extend(inline(function, callee, instr))
+
+		if len(code) != len(function.code):
+			function.code = code
+			changed.append(function)
+	return changed
+
+
+def optimize(program, whole_program=True, inline_limit=INLINE_LIMIT):
+	# passes in order, declarations compiled on their own (incremental
+	# compiles) are not a whole program and calls are not inlined in them
+	for function in program.functions:
+		promote_variables(function)
+		function.code = propagate_copies(function.code)
+	fold_constants(program)
+
+	if whole_program:
+		remove_unreachable(program)
+		inlined = inline_calls(program, inline_limit)
+		if inlined:
+			for function in inlined:
+				function.code = propagate_copies(function.code)
+			fold_constants(program, inlined)
+			remove_unreachable(program)
+
+	for function in program.functions:
+		if optimize_loops(function):
+			function.code = remove_dead_code(propagate_copies(function.code))
+	return program
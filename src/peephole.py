@@ -0,0 +1,244 @@
+import re
+from collections import Counter
+
+from emitter import INSTRUCTION, LABEL
+
+
+# peephole optimizations of the mips of functions (Emitter records),
+# run by MipsBackend.fragment
+#
+#	stack:	addi $sp,$sp,k are delayed and merged, loads and stores
+#			through $sp in between get their offsets changed
+#	memory:	a lw/l.s of an address that was just stored or loaded becomes a
+#			move (or disappears), stores of a value that is already there and
+#			stores overwritten before they are read are removed
+#	moves:	move $x,$x and moves back and forth
+#	jumps:	jumps and branches to the label right after them
+RULES = ('stack', 'memory', 'moves', 'jumps')
+
+MEMORY_OPERAND = re.compile(r'(-?\d+)\((\$\w+)\)$')
+
+LOADS = {'lw': 'move', 'l.s': 'mov.s'}		# load -> move between registers
+STORES = {'sw': 'lw', 's.s': 'l.s'}		# store -> load of the stored value
+BRANCHES = {'j', 'b', 'beq', 'bne', 'blt', 'ble', 'bgt', 'bge', 'beqz', 'bnez', 'bc1t', 'bc1f'}
+CALLS = {'jal', 'jalr', 'syscall'}
+# instructions that do not write their first operand
+NO_DESTINATION = {'sw', 's.s', 'sb', 'jr', 'c.eq.s', 'c.lt.s', 'c.le.s', 'mtc1', *BRANCHES, *CALLS}
+
+
+def written(op, args):
+	# register written by an instruction (calls are handled on their own)
+	if op == 'mtc1':
+		return args[1]
+	if op in NO_DESTINATION or not args:
+		return None
+	return args[0]
+
+def memory_operand(arg):
+	# (offset, base register) of an operand like -8($fp)
+	match = MEMORY_OPERAND.match(str(arg))
+	return (int(match[1]), match[2]) if match else None
+
+def region(base):
+	# decaf has no pointers to the stack, globals are only reached through $gp
+	if base in ('$sp', '$fp'):
+		return 'stack'
+	if base == '$gp':
+		return 'global'
+	return 'heap'
+
+def may_alias(address1, address2, byte=False):
+	if region(address1[1]) != region(address2[1]):
+		return False
+	if address1[1] != address2[1]:
+		return True
+	# same base, words do not overlap unless they are the same
+	return byte or address1[0] == address2[0]
+
+
+def count_instructions(records):
+	return sum(1 for r in records if r[0] == INSTRUCTION)
+
+
+def collapse_stack(records):
+	out = []
+	pending = 0		# addi $sp,$sp,pending not done yet
+
+	def flush():
+		nonlocal pending
+		if pending:
+			out.append((INSTRUCTION, 'addi', ('$sp', '$sp', pending), None))
+		pending = 0
+
+	for record in records:
+		kind, op, args, comment = record
+		if kind == LABEL:
+			flush()
+		elif kind == INSTRUCTION:
+			address = memory_operand(args[1]) if len(args) == 2 else None
+			if op == 'addi' and args[0] == args[1] == '$sp':
+				pending += args[2]
+				continue
+			elif not pending:
+				pass
+			elif address and address[1] == '$sp' and args[0] != '$sp' and op != 'mtc1':
+				record = (kind, op, (args[0], f'{address[0] + pending}($sp)'), comment)
+			elif args and args[0] == '$sp' and op not in NO_DESTINATION and not any('$sp' in str(a) for a in args[1:]):
+				pending = 0		# $sp is set to something else
+			elif any('$sp' in str(a) for a in args) or op in BRANCHES or op in CALLS or op == 'jr':
+				flush()
+		out.append(record)
+
+	flush()
+	return out
+
+
+def forward_memory(records):
+	out = []
+	values = {}		# address -> (register, load op): register has the value at address
+	stores = {}		# address -> index in out of a store that was not read yet
+
+	def clobber(register):
+		for address, (value, _) in list(values.items()):
+			if value == register or address[1] == register:
+				del values[address]
+		for address in [a for a in stores if a[1] == register]:
+			del stores[address]
+
+	for record in records:
+		kind, op, args, comment = record
+		if kind == LABEL:
+			values.clear()
+			stores.clear()
+		if kind != INSTRUCTION:
+			out.append(record)
+			continue
+
+		if op in CALLS:
+			values.clear()
+			stores.clear()
+			out.append(record)
+			continue
+
+		if op in BRANCHES or op == 'jr':
+			stores.clear()
+			out.append(record)
+			continue
+
+		address = memory_operand(args[1]) if op in ('lw', 'l.s', 'lb', 'sw', 's.s', 'sb') else None
+		if op in ('lw', 'l.s', 'lb', 'sw', 's.s', 'sb') and address is None:
+			# label address
+			values.clear()
+			stores.clear()
+			out.append(record)
+			continue
+
+		if op in ('lw', 'l.s', 'lb'):
+			register = args[0]
+			for a in [a for a in stores if may_alias(a, address, op == 'lb')]:
+				del stores[a]
+
+			known = values.get(address)
+			if known and known[1] == op:
+				if known[0] == register:
+					continue
+				record = (INSTRUCTION, LOADS[op], (register, known[0]), comment)
+			clobber(register)
+			if op != 'lb' and address[1] != register and address not in values:
+				values[address] = (register, op)
+
+		elif op in ('sw', 's.s', 'sb'):
+			register = args[0]
+			if op != 'sb' and values.get(address) == (register, STORES[op]):
+				continue		# already there
+
+			if op != 'sb' and address in stores:
+				out[stores.pop(address)] = None		# overwritten before it was read
+			for a in [a for a in values if may_alias(a, address, op == 'sb')]:
+				del values[a]
+			if op != 'sb':
+				values[address] = (register, STORES[op])
+				stores[address] = len(out)
+
+		else:
+			register = written(op, args)
+			if register:
+				clobber(register)
+
+		out.append(record)
+
+	return [record for record in out if record is not None]
+
+
+def remove_moves(records):
+	out = []
+	last = None		# (op, args) of the last instruction if it was a move
+	for record in records:
+		kind, op, args, comment = record
+		if kind == LABEL:
+			last = None
+		if kind != INSTRUCTION:
+			out.append(record)
+			continue
+
+		if op in ('move', 'mov.s'):
+			if args[0] == args[1]:
+				continue
+			if last == (op, (args[1], args[0])):
+				continue
+			last = (op, args)
+		else:
+			last = None
+		out.append(record)
+	return out
+
+
+def remove_jumps(records):
+	out = []
+	for i, record in enumerate(records):
+		kind, op, args, comment = record
+		if kind == INSTRUCTION and op in BRANCHES and op not in ('bc1t', 'bc1f'):
+			# labels right after the jump
+			labels = set()
+			for next_kind, name, _, _ in records[i + 1:]:
+				if next_kind == INSTRUCTION:
+					break
+				if next_kind == LABEL:
+					labels.add(name)
+			if args[-1] in labels:
+				continue
+		out.append(record)
+	return out
+
+
+PASSES = {
+	'stack': collapse_stack,
+	'memory': forward_memory,
+	'moves': remove_moves,
+	'jumps': remove_jumps,
+}
+
+
+def optimize(records, rules=RULES):
+	# returns the optimized records and a Counter of removed instructions by rule
+	removed = Counter()
+	for rule in RULES:
+		if rule not in rules:
+			continue
+		before = count_instructions(records)
+		records = PASSES[rule](records)
+		removed[rule] += before - count_instructions(records)
+	return records, removed
+
+
+def parse_rules(text):
+	# comma separated rule names, 'all' or 'none'
+	if text == 'all':
+		return RULES
+	if text == 'none':
+		return ()
+	rules = tuple(rule.strip() for rule in text.split(',') if rule.strip())
+	for rule in rules:
+		if rule not in PASSES:
+			raise ValueError(f"unknown peephole rule '{rule}' (rules: {', '.join(RULES)})")
+	return rules
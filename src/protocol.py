@@ -0,0 +1,40 @@
+# Wire format of the compile daemon (see server.py and client.py).
+# Every message is a 4 byte big endian length followed by that many bytes of utf-8 json.
+# Only the standard library is imported here, so the client starts fast.
+
+import json
+import os
+import struct
+import tempfile
+
+header = struct.Struct('>I')
+
+default_socket_path = os.environ.get(
+	'DECAF_SOCKET',
+	os.path.join(tempfile.gettempdir(), f'decaf-compiler-{os.getuid()}.sock')
+)
+
+
+def send_message(f, message):
+	data = json.dumps(message).encode()
+	f.write(header.pack(len(data)))
+	f.write(data)
+	f.flush()
+
+
+def recv_exactly(f, size):
+	data = f.read(size)
+	if len(data) < size:
+		return None
+	return data
+
+
+def recv_message(f):
+	# returns None when the other side closed the connection
+	head = recv_exactly(f, header.size)
+	if head is None:
+		return None
+	data = recv_exactly(f, header.unpack(head)[0])
+	if data is None:
+		return None
+	return json.loads(data.decode())
@@ -0,0 +1,140 @@
+from bisect import bisect_right
+
+from flow import basic_blocks, successors, defs
+
+
+# registers for temps, the backend keeps the others for itself
+# ($t8, $t9, $f0, $f2 for spilled operands, $a, $v, $f12 for calls and syscalls)
+INT_CALLER_SAVED = [f'$t{i}' for i in range(8)]
+INT_CALLEE_SAVED = [f'$s{i}' for i in range(8)]
+# no $f register is saved by functions
+FLOAT_REGISTERS = [f'$f{i}' for i in range(4, 32, 2) if i != 12]
+
+
+def live_out(code, blocks, succ):
+	# temps live at the end of each block (backwards data flow)
+	use = []
+	kill = []
+	for start, end in blocks:
+		u = set()
+		k = set()
+		for instr in reversed(code[start:end]):
+			for t in defs(instr):
+				k.add(t)
+				u.discard(t)
+			u.update(instr.uses())
+		use.append(u)
+		kill.append(k)
+
+	live_in = [set() for _ in blocks]
+	out = [set() for _ in blocks]
+	changed = True
+	while changed:
+		changed = False
+		for n in reversed(range(len(blocks))):
+			o = set()
+			for s in succ[n]:
+				o |= live_in[s]
+			i = use[n] | (o - kill[n])
+			if len(i) != len(live_in[n]) or len(o) != len(out[n]):
+				live_in[n] = i
+				out[n] = o
+				changed = True
+	return out
+
+
+def live_intervals(code):
+	# temp -> [first, last] index of code where the temp is live
+	# (one interval per temp, holes are ignored)
+	blocks = basic_blocks(code)
+	out = live_out(code, blocks, successors(code, blocks))
+
+	intervals = {}
+	def mark(t, i):
+		interval = intervals.get(t)
+		if interval is None:
+			intervals[t] = [i, i]
+		elif i < interval[0]:
+			interval[0] = i
+		elif i > interval[1]:
+			interval[1] = i
+
+	for n, (start, end) in enumerate(blocks):
+		live = set(out[n])
+		for i in reversed(range(start, end)):
+			instr = code[i]
+			for t in live:
+				mark(t, i)
+			for t in defs(instr):
+				mark(t, i)
+				live.discard(t)
+			for t in instr.uses():
+				mark(t, i)
+				live.add(t)
+	return intervals
+
+
+class Allocation():
+	"""
+	Registers of the temps of one function (linear scan).
+
+		registers:	temp -> register, spilled temps are not in it
+		slots:		spilled temp -> stack slot number
+	"""
+
+	def __init__(self):
+		self.registers = {}
+		self.slots = {}
+
+
+def allocate(code, clobbers):
+	# clobbers(instr) is true for instructions after which the caller
+	# saved registers ($t, $f) are changed (calls)
+	intervals = live_intervals(code)
+	calls = [i for i, instr in enumerate(code) if clobbers(instr)]
+
+	def crosses_call(interval):
+		# a call where the temp is live before and after
+		n = bisect_right(calls, interval[0])
+		return n < len(calls) and calls[n] < interval[1]
+
+	allocation = Allocation()
+	free = {False: INT_CALLER_SAVED + INT_CALLEE_SAVED, True: list(FLOAT_REGISTERS)}
+	active = []		# (temp, interval) with a register
+
+	def spill(t):
+		allocation.slots[t] = len(allocation.slots)
+
+	for t, interval in sorted(intervals.items(), key=lambda item: item[1][0]):
+		# temps that died before this one starts give back their registers
+		# (operands are read before the result is written)
+		for entry in [entry for entry in active if entry[1][1] <= interval[0]]:
+			active.remove(entry)
+			free[entry[0].is_float].append(allocation.registers[entry[0]])
+
+		if t.is_float:
+			allowed = [] if crosses_call(interval) else FLOAT_REGISTERS
+		elif crosses_call(interval):
+			allowed = INT_CALLEE_SAVED
+		else:
+			allowed = INT_CALLER_SAVED + INT_CALLEE_SAVED
+
+		register = next((r for r in allowed if r in free[t.is_float]), None)
+		if register is None:
+			# no free register: spill the temp that lives longest
+			candidates = [entry for entry in active if allocation.registers[entry[0]] in allowed]
+			victim = max(candidates, key=lambda entry: entry[1][1], default=None)
+			if victim is None or victim[1][1] <= interval[1]:
+				spill(t)
+				continue
+
+			active.remove(victim)
+			register = allocation.registers.pop(victim[0])
+			spill(victim[0])
+			free[t.is_float].append(register)
+
+		free[t.is_float].remove(register)
+		allocation.registers[t] = register
+		active.append((t, interval))
+
+	return allocation
@@ -1,12 +1,27 @@
 import sys, getopt
 import re
-from collections import namedtuple
 
-debug = False 
+from lark.lexer import Lexer, Token as LarkToken
+from lark.exceptions import UnexpectedCharacters
 
-Token = namedtuple('Token', 'group, value')
+debug = False
 
-keywords = (
+
+class Token():
+	__slots__ = ('group', 'value', 'line', 'column', 'pos')
+
+	def __init__(self, group, value, line, column, pos):
+		self.group = group
+		self.value = value
+		self.line = line		# starts from 1
+		self.column = column	# starts from 1
+		self.pos = pos			# index in code
+
+	def __repr__(self):
+		return f"Token({self.group!r}, {self.value!r}, {self.line}:{self.column})"
+
+
+keywords = frozenset((
 "void",
 "int",
 "double",
@@ -37,7 +52,7 @@ keywords = (
 "private",
 "protected",
 "public"
-)
+))
 
 token_specification = [
 	('T_BOOLEANLITERAL',r'(false|true)\b'),           							 			# Boolean
@@ -48,16 +63,19 @@ token_specification = [
 	('OP_PUNCTUATION',	r'==|>=|<=|<|>|\+|\-|\*|\/|\%|\=|!=|\|\||\&\&|!|;|,|\.|\[|\]|\(|\)|\{|\}'), # OP and PUNCT
 	('T_STRINGLITERAL', r'\"[^\n\"]*\"'),        											# String
 	('NEWLINE',  		r'\n'),           													# Line endings
-	('SKIP',     		r'[ \t\v\f]+'),      												# Skip over spaces and tabs
+	('SKIP',     		r'[ \t\v\f\r]+'),      												# Skip over spaces and tabs
 	('MISMATCH', 		r'.'),            													# Any other character
 ]
 
+# compiled once, tokens are matched in a single pass over the code
+master_regex = re.compile('|'.join('(?P<{}>{})'.format(t[0], t[1]) for t in token_specification))
 
-def tokenize(code):
-	regex = '|'.join('(?P<{}>{})'.format(t[0], t[1]) for t in token_specification)
+
+def scan(code):
+	# generator of Tokens, stops after a MISMATCH token
 	line_num = 1
-	tokens = []
-	for match in re.finditer(regex, code):
+	line_start = 0
+	for match in master_regex.finditer(code):
 		value = match.group()
 		group = match.lastgroup
 
@@ -68,16 +86,89 @@ def tokenize(code):
 			group = "KEYWORD"
 		elif group == 'NEWLINE':
 			line_num += 1
+			line_start = match.end()
+			continue
+		elif group == 'SKIP':
 			continue
-		elif group == 'SKIP' or group == "COMMENT":
+		elif group == 'COMMENT':
+			newlines = value.count('\n')
+			if newlines:
+				line_num += newlines
+				line_start = match.start() + value.rindex('\n') + 1
 			continue
-		elif group == 'MISMATCH':
+
+		pos = match.start()
+		yield Token(group, value, line_num, pos - line_start + 1, pos)
+
+		if group == 'MISMATCH':
+			return
+
+
+def tokenize(code):
+	tokens = []
+	for token in scan(code):
+		if token.group == 'MISMATCH':
 			return ('UNDEFINED_TOKEN', tokens)
-		token = Token(group=group, value=value)
 		tokens.append(token)
 	return (None, tokens)
 
 
+# terminals of grammer.lark that are matched by a regex
+lark_terminals = {
+	'T_ID': 'IDENT',
+	'T_BOOLEANLITERAL': 'BOOLCONSTANT',
+	'T_DOUBLELITERAL': 'DOUBLECONSTANT',
+	'T_INTLITERAL': 'INTCONSTANT',
+	'T_STRINGLITERAL': 'STRINGCONSTANT',
+}
+
+# after these a sign is an operator, not part of a double (like lark's contextual lexer)
+operand_end = frozenset(('IDENT', 'BOOLCONSTANT', 'DOUBLECONSTANT', 'INTCONSTANT', 'STRINGCONSTANT', 'NULL', 'THIS', ')', ']'))
+
+
+class LarkLexer(Lexer):
+	"""
+	scan() as a lark lexer, for Lark(..., lexer=LarkLexer).
+
+	Keywords and punctuation are matched to the grammar's string
+	terminals by value.
+	"""
+
+	def __init__(self, lexer_conf):
+		self.string_terminals = {t.pattern.value: t.name for t in lexer_conf.tokens if t.pattern.type == 'str'}
+
+	def lex(self, code):
+		string_terminals = self.string_terminals
+		last = None
+		for token in scan(code):
+			group = token.group
+			value = token.value
+			column = token.column
+			pos = token.pos
+
+			if group == 'T_DOUBLELITERAL' and value[0] in '+-' and last in operand_end:
+				# split "-1.5" after an operand into "-" "1.5"
+				yield self.lark_token(string_terminals[value[0]], value[0], token.line, column, pos)
+				value = value[1:]
+				column += 1
+				pos += 1
+
+			type_ = lark_terminals.get(group)
+			if type_ is None:
+				type_ = string_terminals.get(value)
+				if type_ is None or group == 'MISMATCH':
+					raise UnexpectedCharacters(code, pos, token.line, column)
+				last = type_ if group == 'KEYWORD' else value
+			else:
+				last = type_
+
+			yield self.lark_token(type_, value, token.line, column, pos)
+
+	def lark_token(self, type_, value, line, column, pos):
+		# tokens never contain new lines (block comments are skipped)
+		return LarkToken(type_, value, pos, line, column, line, column + len(value), pos + len(value))
+
+
 def debug_main(code):
 	global debug
 	debug = True
@@ -86,14 +177,13 @@ def debug_main(code):
 	print("~~~input")
 	print(code)
 	try:
-		err, tokens = tokenize(code)
 		print("~~~tokens:")
-		for t in tokens:
-			if t.group == "OP_PUNCTUATION" or t.group == "KEYWORD":
+		for t in scan(code):
+			if t.group == 'MISMATCH':
+				print('UNDEFINED_TOKEN')
+			elif t.group == "OP_PUNCTUATION" or t.group == "KEYWORD":
 				print(t.value)
 			else:
 				print(t.group, t.value)
-		if err is not None:
-			print(err)
 	except RuntimeError as e:
 		print("SyntaxError:", e)
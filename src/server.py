@@ -0,0 +1,121 @@
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+from lark.exceptions import LarkError, UnexpectedInput
+
+import cgen
+import my_parser
+from protocol import default_socket_path, send_message, recv_message
+from utils import SemanticError
+
+
+def compile_request(request):
+	"""
+	request: {"code": decaf source, "check": only check the code (optional)}
+	response: {"status": "ok", "mips": ...}
+		| {"status": "semantic_error", "mips": ..., "error": {"message", "line", "col"}}
+		| {"status": "syntax_error", "error": {"message", "line", "col"}}
+		| {"status": "error", "error": {"message"}}
+	there is no "mips" in responses to checks
+	"""
+	code = request.get('code')
+	if not isinstance(code, str):
+		return {'status': 'error', 'error': {'message': "request needs a 'code' string"}}
+
+	check = bool(request.get('check'))
+	try:
+		if check:
+			cgen.check_code(code)
+			return {'status': 'ok'}
+		return {'status': 'ok', 'mips': cgen.compile_code(code).getvalue()}
+
+	except SemanticError as err:
+		response = {
+			'status': 'semantic_error',
+			'error': {'message': err.message, 'line': err.line, 'col': err.col},
+		}
+		if not check:
+			response['mips'] = cgen.semantic_error_assembly().getvalue()
+		return response
+
+	except UnexpectedInput as err:
+		return {
+			'status': 'syntax_error',
+			'error': {'message': str(err), 'line': err.line, 'col': err.column},
+		}
+
+	except LarkError as err:
+		return {'status': 'syntax_error', 'error': {'message': str(err), 'line': 0, 'col': 0}}
+
+	except Exception as err:
+		return {'status': 'error', 'error': {'message': f"{type(err).__name__}: {err}"}}
+
+
+class CompileHandler(socketserver.StreamRequestHandler):
+	# one connection may send any number of requests
+	def handle(self):
+		while True:
+			try:
+				request = recv_message(self.rfile)
+			except ValueError as err:
+				send_message(self.wfile, {'status': 'error', 'error': {'message': f"bad request: {err}"}})
+				return
+
+			if request is None:
+				return
+
+			send_message(self.wfile, compile_request(request))
+
+
+class CompileServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+	# a process per connection: compiles share module level state (builtin
+	# types and their array types, stats.no_stats), threads would race on it
+	block_on_close = False
+
+
+def remove_stale_socket(socket_path):
+	if not os.path.exists(socket_path):
+		return
+
+	s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		s.connect(socket_path)
+	except OSError:
+		# nobody is listening
+		os.unlink(socket_path)
+		return
+	finally:
+		s.close()
+
+	raise RuntimeError(f"a compile server is already listening on {socket_path}")
+
+
+def stop_server(signum, frame):
+	raise KeyboardInterrupt
+
+
+def serve(socket_path=default_socket_path):
+	# load everything a compile needs before accepting requests
+	my_parser.get_parser()
+
+	remove_stale_socket(socket_path)
+
+	old_umask = os.umask(0o077)	# socket is only usable by this user
+	try:
+		server = CompileServer(socket_path, CompileHandler)
+	finally:
+		os.umask(old_umask)
+
+	signal.signal(signal.SIGTERM, stop_server)
+
+	print(f"compile server listening on {socket_path}", file=sys.stderr)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		os.unlink(socket_path)
@@ -0,0 +1,81 @@
+import json
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+
+class CompileStats():
+	"""
+	Wall time, peak memory and visit counts of the compiler phases.
+
+	Used with `main.py --stats <file>`; compile_code only records
+	anything when it is given a CompileStats.
+	"""
+
+	def __init__(self):
+		self.phases = {}		# name -> {'time': seconds, 'peak_memory': bytes allocated during the phase}
+		self.visits = {}		# phase name -> Counter of rule names
+		self.counts = {}		# e.g. tac_instructions, mips_instructions
+
+	@contextmanager
+	def phase(self, name):
+		started = not tracemalloc.is_tracing()
+		if started:
+			tracemalloc.start()
+		tracemalloc.reset_peak()
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			elapsed = time.perf_counter() - start
+			_, peak = tracemalloc.get_traced_memory()
+			if started:
+				tracemalloc.stop()
+			self.phases[name] = {'time': elapsed, 'peak_memory': peak}
+
+	def count_visits(self, name, visitor):
+		# count rules visited by visitor (a lark Visitor or Interpreter)
+		counter = self.visits.setdefault(name, Counter())
+
+		if hasattr(type(visitor), '_call_userfunc'):
+			call = visitor._call_userfunc
+			def counted(tree):
+				counter[tree.data] += 1
+				return call(tree)
+			visitor._call_userfunc = counted
+		else:
+			visit = visitor.visit
+			def counted(tree):
+				counter[tree.data] += 1
+				return visit(tree)
+			visitor.visit = counted
+
+		return visitor
+
+	def as_dict(self):
+		return {
+			'phases': self.phases,
+			'visits': {name: dict(counter.most_common()) for name, counter in self.visits.items()},
+			'counts': self.counts,
+		}
+
+	def write(self, output_file):
+		json.dump(self.as_dict(), output_file, indent=2)
+		output_file.write('\n')
+
+
+class NoStats():
+	# stands in for a CompileStats when nothing is recorded
+
+	def __init__(self):
+		self.counts = {}
+
+	@contextmanager
+	def phase(self, name):
+		yield
+
+	def count_visits(self, name, visitor):
+		return visitor
+
+no_stats = NoStats()
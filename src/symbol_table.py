@@ -1,58 +1,84 @@
 from lark.lexer import Token
 from utils import SemanticError
-from lark.visitors import  Interpreter, Visitor_Recursive, Visitor
 from lark import Tree
+from types import GeneratorType, MappingProxyType
+
+from interpreter import Interpreter
 
 
 class Type():
+	"""
+	There is one Type object per type: builtin types are in builtin_types,
+	each class and interface gets one when it is declared and array types
+	are made by Type.array, so types are compared with `is`.
+	(SymbolTableVisitor pushes name only Types, TypeVisitor replaces them.)
+	"""
+	__slots__ = ('name', 'size', 'arr_type', 'class_ref', 'interface_ref', 'array_type', 'value_variable')
+
 	def __init__(self, name, size=None, arr_type=None, class_ref=None, interface_ref=None):
 		self.name = name
 		self.size = size
 		self.arr_type = arr_type
 		self.class_ref = class_ref
-		self.interface_ref = interface_ref;
+		self.interface_ref = interface_ref
+		self.array_type = None
+		self.value_variable = None
+
+	def array(self):
+		# the type of arrays of self
+		if self.array_type is None:
+			self.array_type = Type("array", 4, arr_type=self)
+		return self.array_type
+
+	def value(self):
+		# nameless Variable of this type, for results of expressions (never changed)
+		if self.value_variable is None:
+			self.value_variable = Variable(type_=self)
+		return self.value_variable
 
 	def are_equal(self, type2):
-		if self.name != type2.name:
-			return False
-		if self.arr_type and not type2.arr_type or\
-			not self.arr_type and type2.arr_type:
-			return False
-
-		if self.class_ref and not type2.class_ref or\
-			not self.class_ref and type2.class_ref:
-			return False
-		
-		if self.class_ref and self.class_ref.name != type2.class_ref.name:
-			return False
-		
-		if self.arr_type:
-			return self.arr_type.are_equal(type2.arr_type)
-		
-		return True
+		return self is type2
 
 	
 	def are_equal_with_upcast(self, type2):
 		# return true if self can upcast to type2
-		if self.arr_type:
-			return self.are_equal(type2)
-
-		if self.class_ref and self.class_ref.can_upcast_to(type2.class_ref):
+		if self is type2:
 			return True
 
-		return self.name == type2.name
+		return bool(self.class_ref and type2.class_ref and self.class_ref.can_upcast_to(type2.class_ref))
 
 
 	def __str__(self) -> str:
 		return f"<T-{self.name}-{self.size}-arr:{self.arr_type}-cls:{None if not self.class_ref else self.class_ref.name}>"
 
 
+# shared by all compilations, types are never changed
+builtin_types = {name: Type(name, size) for name, size in (
+	("int", 4),
+	("double", 4),
+	("bool", 4),
+	("string", 4),
+	("void", 0),
+	("array", 4),
+	("null", 4),
+)}
+
+
 class Variable():
-	def __init__(self, name= None, type_:Type = None, address = None, size = 0):
+	"""
+	address depends on storage:
+		'global'	byte offset in static memory ($gp)
+		'local'		none, locals are temps (optimize.promote_variables)
+		'formal'	index in the formals of the function ('this' is 0 in methods)
+	"""
+	__slots__ = ('name', 'type_', 'address', 'size', 'storage')
+
+	def __init__(self, name= None, type_:Type = None, address = None, size = 0, storage = 'global'):
 		self.name = name
 		self.type_ = type_
 		self.address = address
 		self.size = size
+		self.storage = storage
 
 
 
@@ -61,6 +87,8 @@ class Variable():
 	
 
 class Function():
+	__slots__ = ('name', 'return_type', 'formals', 'label')
+
 	def __init__(self, name, formals=[], return_type:Type = None, prefix_label = ''):
 		self.name = name
 		self.return_type = return_type
@@ -81,12 +109,14 @@ class Function():
 		return f"<F-{self.name}-{self.return_type}-{[a.__str__() for a in self.formals]}>"
 
 class Interface():
+	__slots__ = ('name', 'address', 'member_functions', 'prototypes')
+
 	def __init__(self, name, address, member_functions={}):
 		self.name = name
 		self.address = address
 		self.member_functions = {}
 		self.prototypes = {}
-		self.set_prototypes = {member_functions}
+		self.set_prototypes(member_functions)
 
 	def get_vtable_size(self): # vtable not included
 		size = len(self.member_functions)
@@ -100,7 +130,53 @@ class Interface():
 
 
 
+class ClassLayout():
+	"""
+	Object and vtable layout of a class, parents included.
+
+	Built once by TypeVisitor when all parents are known; the tables are
+	read only after that.
+		variables:		name -> (Variable, index in object, vtable not included)
+		functions:		name -> (Function, index in vtable)
+		access_modes:	name -> access mode of the class that declares it
+		ancestors:		names of the class and all its parents
+	A name declared by a parent keeps the parent's entry.
+	"""
+	__slots__ = ('variables', 'functions', 'access_modes', 'object_size', 'vtable_size', 'ancestors')
+
+	def __init__(self, class_, parent_layout=None):
+		variables = {}
+		functions = {}
+		access_modes = {}
+		object_size = 0
+		vtable_size = 0
+		ancestors = {class_.name}
+		if parent_layout:
+			ancestors.update(parent_layout.ancestors)
+			variables.update(parent_layout.variables)
+			functions.update(parent_layout.functions)
+			access_modes.update(parent_layout.access_modes)
+			object_size = parent_layout.object_size
+			vtable_size = parent_layout.vtable_size
+
+		for index, (name, variable) in enumerate(class_.member_data.items()):
+			variables.setdefault(name, (variable, object_size + index))
+		for index, (name, function) in enumerate(class_.member_functions.items()):
+			functions.setdefault(name, (function, vtable_size + index))
+		access_modes.update(class_.access_modes)
+
+		self.variables = MappingProxyType(variables)
+		self.functions = MappingProxyType(functions)
+		self.access_modes = MappingProxyType(access_modes)
+		self.object_size = object_size + len(class_.member_data)
+		self.vtable_size = vtable_size + len(class_.member_functions)
+		self.ancestors = frozenset(ancestors)
+
+
 class Class():
+	__slots__ = ('name', 'address', 'member_data', 'member_functions', 'fields', 'access_modes',
+		'parent', 'interfaces', 'layout', 'type_')
+
 	def __init__(self, name, address, member_data= {}, member_functions={}, parent=None):
 		self.name = name
 		self.address = address
@@ -110,50 +186,43 @@ class Class():
 		self.access_modes = {}
 		self.parent = parent
 		self.interfaces = {}
+		self.layout = None		# ClassLayout, set by build_layout
+		self.type_ = None		# the Type of the class
 		self.set_fields(member_data, member_functions)
 
+	def build_layout(self):
+		# after parents are resolved (TypeVisitor)
+		# also builds the layouts of parents that do not have one yet
+		chain = []
+		class_ = self
+		while class_ and not class_.layout:
+			if class_ in chain:
+				raise SemanticError(f"class '{class_.name}' extends itself")
+			chain.append(class_)
+			class_ = class_.parent
+
+		parent_layout = class_.layout if class_ else None
+		for class_ in reversed(chain):
+			class_.layout = parent_layout = ClassLayout(class_, parent_layout)
+
+		return self.layout
+
 	def get_access_mode(self, name):
-		if name in self.access_modes:
-			return self.access_modes[name]
-		
-		if self.parent:
-			return self.parent.get_access_mode(name)
+		return self.layout.access_modes.get(name)
 	
 	def get_object_size(self): # vtable not included
-		size = len(self.member_data)
-		if self.parent:
-			size += self.parent.get_object_size()
-		return size
+		return self.layout.object_size
 
 
 	def get_vtable_size(self): # vtable not included
-		size = len(self.member_functions)
-		if self.parent:
-			size += self.parent.get_vtable_size()
-		return size
+		return self.layout.vtable_size
 			
 
 	def can_upcast_to(self, class2):
 		# check if self can upcat to class2
-		if self.name == class2.name:
-			return True
-		
-		if not self.parent:
-			return False
-		
-		return self.parent.can_upcast_to(class2)
+		return class2.name in self.layout.ancestors
 
 
-	def get_func_index_offset(self):
-		if not self.parent:
-			return 0
-		return self.parent.get_func_index_offset() + len(self.parent.member_functions)
-	
-	def get_var_index_offset(self):
-		if not self.parent:
-			return 0
-		return self.parent.get_var_index_offset() + len(self.parent.member_data)
-	
 	def set_fields(self, member_data, member_functions):
 		self.member_data = member_data
 		self.member_functions = member_functions
@@ -165,28 +234,16 @@ class Class():
 
 
 	def get_func_and_index(self, name, error=True, tree=None):
-		if self.parent:
-			f, i = self.parent.get_func_and_index(name, error=False)
-			if f:
-				return (f, i)
-		
-		if name in self.member_functions:
-			index = list(self.member_functions.keys()).index(name)
-			return (self.member_functions[name], self.get_func_index_offset() + index)
+		if name in self.layout.functions:
+			return self.layout.functions[name]
 		
 		if error:
 			raise SemanticError(f'Function {name} not found in class {self.name}', tree=tree)
 		return (None, None)
 
 	def get_var_and_index(self, name, error=True, tree=None):
-		if self.parent:
-			f, i = self.parent.get_var_and_index(name, error=False)
-			if f:
-				return (f,i)
-		
-		if name in self.member_data:
-			index = list(self.member_data.keys()).index(name)
-			return (self.member_data[name], self.get_var_index_offset() + index)
+		if name in self.layout.variables:
+			return self.layout.variables[name]
 		
 		if error:
 			raise SemanticError(f'Variable {name} not found in class {self.name}', tree=tree)
@@ -199,73 +256,79 @@ class Class():
 			# \n\tdata: {[v.__str__() for v in self.member_data.values()]}\
 			# \n\tmethods: {[v.__str__() for v in self.member_functions.values()]}>"
 
-interface_stack = []
-class_stack = []
-currect_access_mode = None
-
-
-last_prime = 1
-def get_next_prime():
-	global last_prime
-
-
-	ok = False
-	while not ok:
-		ok = True
-		last_prime += 1
-		for i in range(2, last_prime):
-			if last_prime % i == 0:
-				ok = False
-	
-	return last_prime
-
-
-
-
 class SymbolTable():
-	symbol_tables = []
+	__slots__ = ('variables', 'functions', 'types', 'prototypes', 'parent', 'root', 'context', 'index')
 
-	def __init__(self, parent=None):
+	def __init__(self, parent=None, context=None):
 		# self.classes = {}		# dict {name: Class}
 		self.variables = {}     # dict {name: Variable}
 		self.functions = {}     # dict {name: Function}
 		self.types = {}			# dict {name: Type}
 		self.prototypes = {}
 		self.parent = parent
-		SymbolTable.symbol_tables.append(self)
+		self.root = parent.root if parent else self		# global scope
+
+		self.context = context
+		if parent and not context:
+			self.context = parent.context
+
+		self.index = -1
+		if self.context:
+			self.index = len(self.context.symbol_tables)
+			self.context.symbol_tables.append(self)
 
 
 	def find_var(self, name, tree=None, error=True, depth_one=False):
-		if name in self.variables:
-			return self.variables[name]
-		if self.parent and not depth_one:
-			return self.parent.find_var(name, tree, error)
+		table = self
+		while table:
+			if name in table.variables:
+				return table.variables[name]
+			table = None if depth_one else table.parent
 
 		if error:
 			raise SemanticError(f'Variable {name} not found in this scope', tree=tree)
 		return None
 
 	def find_func(self, name, tree=None, error=True, depth_one=False):
-		if name in self.functions:
-			return self.functions[name]
-		if self.parent and not depth_one:
-			return self.parent.find_func(name, tree, error)
+		table = self
+		while table:
+			if name in table.functions:
+				return table.functions[name]
+			table = None if depth_one else table.parent
 
 		if error:
 			raise SemanticError(f'Function {name} not found in this scope', tree=tree)
 		return None
 
 	def find_type(self, name, tree=None, error=True, depth_one=False):
-		if name in self.types:
-			return self.types[name]
-		if self.parent and not depth_one:
-			return self.parent.find_type(name, tree, error)
+		table = self
+		while table:
+			if name in table.types:
+				return table.types[name]
+			table = None if depth_one else table.parent
 
 		if error:
 			raise SemanticError(f'Type {name} not found in this scope', tree=tree)
 		return None
 
 
+	# resolve_* are for complete scopes (NameResolver), they do not walk parents
+
+	def resolve_func(self, name, tree=None):
+		# global functions, methods are found through their class
+		function = self.root.functions.get(name)
+		if function is None:
+			raise SemanticError(f'Function {name} not found in this scope', tree=tree)
+		return function
+
+	def resolve_type(self, name, tree=None):
+		# types are only declared in the global scope
+		type_ = self.root.types.get(name)
+		if type_ is None:
+			raise SemanticError(f'Type {name} not found in this scope', tree=tree)
+		return type_
+
+
 	def add_var(self, var:Variable, tree=None):
 		if self.find_var(var.name, error=False, depth_one=True):
 			raise SemanticError('Variable already exist in scope', tree=tree)
@@ -287,7 +350,7 @@ class SymbolTable():
 
 
 	def get_index(self):
-		return SymbolTable.symbol_tables.index(self)
+		return self.index
 
 	def __str__(self) -> str:
 		return f"SYMBOLYABLE: {self.get_index()} \
@@ -297,101 +360,116 @@ class SymbolTable():
 
 
 
-class ParentVisitor(Visitor):
-	def __default__(self, tree):
-		for subtree in tree.children:
-			if isinstance(subtree, Tree):
-				assert not hasattr(subtree, 'parent')
-				subtree.parent = tree
+class ScopeVisitor(Interpreter):
+	"""
+	Interpreter that keeps the scope of the visited node in self.scope.
+
+	Scopes are not stored in the tree: context.scopes maps the nodes that
+	open a scope (program, class and interface declarations, functions
+	(formals) and statement blocks that declare variables) to their
+	SymbolTable, by id(node).
+	"""
+
+	def __init__(self, context):
+		self.context = context
+		self.scope = None
+
+	def _call_userfunc(self, tree):
+		scope = self.context.scopes.get(id(tree))
+		if scope is None:
+			return super()._call_userfunc(tree)
+		return self.visit_in_scope(scope, tree)
 
+	def visit_in_scope(self, scope, tree):
+		outer = self.scope
+		self.scope = scope
+		self.enter_scope(scope)
 
+		result = super()._call_userfunc(tree)
+		if isinstance(result, GeneratorType):
+			result = yield from result
 
+		self.exit_scope(scope)
+		self.scope = outer
+		return result
 
-### stack contains last type:Type visited, remember to pop from stack
-# also remember to push into stack :)
-stack = [] 
+	def enter_scope(self, scope):
+		pass
 
-def IncDataPointer(size):
-	cur = SymbolTableVisitor.data_pointer
-	SymbolTableVisitor.data_pointer += size
-	return cur
+	def exit_scope(self, scope):
+		pass
 
-class SymbolTableVisitor(Interpreter):
-	data_pointer = 0
+	def new_scope(self, tree):
+		# (SymbolTableVisitor) scope opened by tree, also made the current
+		# scope. the caller restores the outer one
+		scope = SymbolTable(parent=self.scope)
+		self.context.scopes[id(tree)] = scope
+		self.scope = scope
+		return scope
+
+
+
+class SymbolTableVisitor(ScopeVisitor):
 	"""
-	Each Node set it's children SymbolTables. 
-	If defining a method make sure to set all children symbol tables
-	and visit children. default gives every child (non token) parent
-	symbol table
+	Declares everything in the current scope (self.scope). Nodes that open
+	a scope call new_scope, the scope of the program is set before.
+
+	context.symbol_stack contains last type:Type visited, remember to pop from stack
+	also remember to push into stack :)
+
+	Variables declared in function bodies (in_function is True) are locals.
 	"""
 
+	def __init__(self, context):
+		super().__init__(context)
+		self.in_function = False
 
 	def __default__(self, tree):
-		for subtree in tree.children:
-			if isinstance(subtree, Tree):
-				subtree.symbol_table = tree.symbol_table
-		
-		self.visit_children(tree)
+		yield from self.visit_children(tree)
 	
 
 	def type(self, tree):
 		type_ = tree.children[0].value
-		stack.append(Type(type_))
+		self.context.symbol_stack.append(Type(type_))
 
 
 	def function_decl(self, tree):
-		# stack frame
-		#			------------------- 		
-		# 			| 	argument n    |			\
-		# 			| 		...		  |				=> caller
-		# 			| 	argument 1    |			/
-		#			------------------- 
-		#  $fp -> 	| saved registers |			\
-		#  $fp - 4	| 		...		  |			 \
-		#			-------------------				=> callee
-		# 			| 	local vars	  |			 /
-		# 			| 		...		  |			/
-		#  $sp ->	| 		...		  |			
-		#  $sp - 4	-------------------
-
-		# access arguments with $fp + 4, $fp + 8, ...
+		# formals are addressed from $fp, see mips.MipsBackend.function
 
 
 		# check if function is a member function
 		function_class = None
-		if len(class_stack) > 0:
-			function_class = class_stack[-1]
+		if len(self.context.class_stack) > 0:
+			function_class = self.context.class_stack[-1]
 
 		# access
-		global currect_access_mode
-		access_mode = currect_access_mode
-		if currect_access_mode:
-			currect_access_mode = None
+		access_mode = self.context.current_access_mode
+		if self.context.current_access_mode:
+			self.context.current_access_mode = None
 		
 
 		# type 
-		type_ = Type("void") # void
+		type_ = builtin_types["void"]
 
 		if isinstance(tree.children[0], Tree):
-			tree.children[0].symbol_table = tree.symbol_table
-			self.visit(tree.children[0])
-			type_ = stack.pop()
+			yield tree.children[0]
+			type_ = self.context.symbol_stack.pop()
 
 		func_name = tree.children[1].value
 
 		# set formal scope and visit formals
-		formals_symbol_table = SymbolTable(parent=tree.symbol_table)
-		tree.children[2].symbol_table = formals_symbol_table
+		outer_symbol_table = self.scope
+		formals_symbol_table = self.new_scope(tree)
 
 		# TODO 
 		# not sure what to do here and what types do formals need to be 
 		# now they are list of types:Type (but without size)
-		sp_initial = len(stack)
-		self.visit(tree.children[2])
+		sp_initial = len(self.context.symbol_stack)
+		yield tree.children[2]
 		formals = []
 		
-		while len(stack) > sp_initial:
-			f = stack.pop()
+		while len(self.context.symbol_stack) > sp_initial:
+			f = self.context.symbol_stack.pop()
 			formals.append(f)
 		
 		formals = formals[::-1]
@@ -400,11 +478,7 @@ class SymbolTableVisitor(Interpreter):
 		if function_class:
 			this = Variable(
 				name="this",
-				type_=Type(
-					name=function_class.name,
-					class_ref=function_class
-				),
-				address= IncDataPointer(4)
+				type_=function_class.type_,
 				)
 			formals = [this, *formals]
 			formals_symbol_table.add_var(this)
@@ -413,23 +487,27 @@ class SymbolTableVisitor(Interpreter):
 			# add access_mode
 			function_class.access_modes[func_name] = access_mode
 
+		for index, formal in enumerate(formals):
+			formal.storage = 'formal'
+			formal.address = index
 		
 
-		# set body scope
-		body_symbol_table = SymbolTable(parent=formals_symbol_table)
-		tree.children[3].symbol_table = body_symbol_table
-		self.visit(tree.children[3])
+		# body (its block has a scope of its own if it declares variables)
+		self.in_function = True
+		yield tree.children[3]
+		self.in_function = False
+		self.scope = outer_symbol_table
 
 		# change function label in mips code to not get confused with other functions with same name
 		prefix_label = ''
 		if function_class:
 			prefix_label = "class_" + function_class.name + "_"
 
-		tree.symbol_table.add_func(Function(
+		self.scope.add_func(Function(
 				name = func_name,
 				return_type = type_,
 				formals = formals,
-				prefix_label=prefix_label
+				prefix_label=prefix_label,
 		),tree)
 
 	
@@ -438,19 +516,17 @@ class SymbolTableVisitor(Interpreter):
 		
 		# check if variable is a member data
 		variable_class = None
-		if len(class_stack) > 0:
-			variable_class = class_stack[-1]
+		if len(self.context.class_stack) > 0:
+			variable_class = self.context.class_stack[-1]
 		
 		# access
-		global currect_access_mode
-		access_mode = currect_access_mode
-		if currect_access_mode:
-			currect_access_mode = None
+		access_mode = self.context.current_access_mode
+		if self.context.current_access_mode:
+			self.context.current_access_mode = None
 		
 
-		tree.children[0].symbol_table = tree.symbol_table
-		self.visit(tree.children[0])
-		type_ = stack.pop()
+		yield tree.children[0]
+		type_ = self.context.symbol_stack.pop()
 
 		var_name = tree.children[1].value
 		
@@ -460,144 +536,64 @@ class SymbolTableVisitor(Interpreter):
 			variable_class.access_modes[var_name] = access_mode
 
 
-		var = Variable(
-				name=var_name,
-				type_=type_,
-				address= IncDataPointer(4),
-				)
-
-		tree.symbol_table.add_var(var, tree)
+		if self.in_function:
+			var = Variable(
+					name=var_name,
+					type_=type_,
+					storage='local',
+					)
+		elif self.scope.parent is None:
+			var = Variable(
+					name=var_name,
+					type_=type_,
+					address= self.context.inc_data_pointer(4),
+					)
+		else:
+			# fields (see ClassLayout) and formals (see function_decl)
+			var = Variable(
+					name=var_name,
+					type_=type_,
+					)
+
+		self.scope.add_var(var, tree)
 		
 		# We need var later (e.g. in formals of funtions)
-		stack.append(var)
+		self.context.symbol_stack.append(var)
 
 
 	def array_type(self, tree):
-		tree.children[0].symbol_table = tree.symbol_table
-		self.visit(tree.children[0])
-		mem_type = stack.pop()
-		stack.append(Type("array",arr_type = mem_type))
-
-
-	def if_stmt(self, tree):
-		
-		# expr
-		tree.children[1].symbol_table = tree.symbol_table
-		self.visit(tree.children[1])
-
-		# body
-		body_symbol_table = SymbolTable(parent=tree.symbol_table)
-		tree.children[2].symbol_table = body_symbol_table
-		self.visit(tree.children[2])
-
-		# else
-		if len(tree.children) > 3:
-			else_symbol_table = SymbolTable(parent=tree.symbol_table)
-			tree.children[4].symbol_table = else_symbol_table
-			self.visit(tree.children[4])
-
-
-	def while_stmt(self, tree):
-		# expr
-		tree.children[1].symbol_table = tree.symbol_table
-		self.visit(tree.children[1])
-
-		# body
-		body_symbol_table = SymbolTable(parent=tree.symbol_table)
-		tree.children[2].symbol_table = body_symbol_table
-		self.visit(tree.children[2])
+		yield tree.children[0]
+		mem_type = self.context.symbol_stack.pop()
+		self.context.symbol_stack.append(Type("array",arr_type = mem_type))
 
 
-	def for_stmt(self, tree):
-		# for types: (number is child number)
-		#	for (2;4;6) 8
-		#	for (2;4;) 7
-		#	for (;3;5) 7
-		# 	for (;3;) 6
-
-		childs = []
-		for subtree in tree.children:
-			if isinstance(subtree, Tree):
-				childs.append(subtree.data)
-			else:
-				childs.append(subtree.value)
-		
-		expr1_num = None
-		expr2_num = None
-		expr3_num = None
-		body_num = None
-
-		# type 1
-		if len(childs) == 9:
-			expr1_num = 2
-			expr2_num = 4
-			expr3_num = 6
-			body_num = 8
-
-		# type 2
-		elif len(childs) == 8 and childs[3] == ';':
-			expr1_num = 2
-			expr2_num = 4
-			body_num = 7
-
-		# type 3
-		elif len(childs) == 8 and childs[2] == ';':
-			expr2_num = 3
-			expr3_num = 5
-			body_num = 7
-
-		# type 4
-		elif len(childs) == 7:
-			expr2_num = 3
-			body_num = 6
-
-		
-		# expr
-		expr_symbol_table = SymbolTable(parent=tree.symbol_table)
-		
-		if expr1_num:
-			tree.children[expr1_num].symbol_table = expr_symbol_table
-			self.visit(tree.children[expr1_num])
-		
-		tree.children[expr2_num].symbol_table = expr_symbol_table
-		self.visit(tree.children[expr2_num])
-			
-		if expr3_num:
-			tree.children[expr3_num].symbol_table = expr_symbol_table
-			self.visit(tree.children[expr3_num])
-			
-		# body
-
-		body_symbol_table = SymbolTable(parent=expr_symbol_table)
-		tree.children[body_num].symbol_table = body_symbol_table
-		self.visit(tree.children[body_num])
-
 	def interface_decl(self, tree):
 		# INTERFACE IDENT "{" prototype* "}"
 		interface_name = tree.children[1].value
 		interface = Interface(
 			name=interface_name,
-			address=IncDataPointer(4),
+			address=self.context.inc_data_pointer(4),
 		)
 		type_ = Type(
 			name=interface_name,
 			interface_ref = interface,
 			size=4
 		)
-		tree.symbol_table.add_type(type_)
+		self.scope.add_type(type_)
 
-		interface_symbol_table = SymbolTable(parent=tree.symbol_table)
+		outer_symbol_table = self.scope
+		interface_symbol_table = self.new_scope(tree)
 
-		interface_stack.append(interface)
+		self.context.interface_stack.append(interface)
 		for subtree in tree.children:
 			if isinstance(subtree, Tree) and subtree.data == 'prototype':
-				subtree.symbol_table = interface_symbol_table
-				initial_stack_len = len(stack)
-				self.visit(subtree)
-				while initial_stack_len < len(stack):
-					stack.pop()
+				initial_stack_len = len(self.context.symbol_stack)
+				yield subtree
+				while initial_stack_len < len(self.context.symbol_stack):
+					self.context.symbol_stack.pop()
 
-		interface_stack.pop()
+		self.context.interface_stack.pop()
+		self.scope = outer_symbol_table
 		interface.set_prototypes(
 			member_functions = interface_symbol_table.prototypes
 		)
@@ -624,7 +620,7 @@ class SymbolTableVisitor(Interpreter):
 
 		class_ = Class(
 			name= class_name,
-			address= IncDataPointer(4),	# this memory will be used for vtable
+			address= self.context.inc_data_pointer(4),	# this memory will be used for vtable
 			parent=parent_name
 		)
 
@@ -633,23 +629,25 @@ class SymbolTableVisitor(Interpreter):
 			class_ref=class_,
 			size=4
 		)
+		class_.type_ = type_
 
-		tree.symbol_table.add_type(type_)
+		self.scope.add_type(type_)
 		
 		# fields
-		class_symbol_table = SymbolTable(parent=tree.symbol_table)
+		outer_symbol_table = self.scope
+		class_symbol_table = self.new_scope(tree)
 
-		class_stack.append(class_)
+		self.context.class_stack.append(class_)
 		
 		for subtree in tree.children:
 			if isinstance(subtree, Tree) and subtree.data == 'field':
-				subtree.symbol_table = class_symbol_table
-				initial_stack_len = len(stack)
-				self.visit(subtree)
-				while initial_stack_len < len(stack):
-					stack.pop()
+				initial_stack_len = len(self.context.symbol_stack)
+				yield subtree
+				while initial_stack_len < len(self.context.symbol_stack):
+					self.context.symbol_stack.pop()
 
-		class_stack.pop()
+		self.context.class_stack.pop()
+		self.scope = outer_symbol_table
 
 		class_.set_fields(
 			member_data=class_symbol_table.variables,
@@ -659,15 +657,11 @@ class SymbolTableVisitor(Interpreter):
 		
 	def field(self, tree):
 		# TODO access mode
-		tree.children[0].symbol_table = tree.symbol_table
-		tree.children[1].symbol_table = tree.symbol_table
-
-		access_mode = self.visit(tree.children[0])
+		access_mode = yield tree.children[0]
 		
-		global currect_access_mode
-		currect_access_mode = access_mode
+		self.context.current_access_mode = access_mode
 
-		self.visit(tree.children[1])
+		yield tree.children[1]
 		
 
 	def access_mode(self, tree):
@@ -678,36 +672,45 @@ class SymbolTableVisitor(Interpreter):
 	
 
 	def statement_block(self, tree):
-		new_symbol_table = SymbolTable(parent=tree.symbol_table)
-		for subtree in tree.children:
-			if isinstance(subtree, Tree):
-				subtree.symbol_table = new_symbol_table
-				self.visit(subtree)
+		# a new scope only if the block declares variables
+		if any(isinstance(subtree, Tree) and subtree.data == 'variable' for subtree in tree.children):
+			outer_symbol_table = self.scope
+			self.new_scope(tree)
+			yield from self.visit_children(tree)
+			self.scope = outer_symbol_table
+		else:
+			yield from self.visit_children(tree)
 
 
 
-class TypeVisitor(Interpreter):
+class TypeVisitor(ScopeVisitor):
 	def __default__(self, tree):
-		self.visit_children(tree)
+		yield from self.visit_children(tree)
 
-	def variable(self, tree):
-		global variable_inits_code
+	def program(self, tree):
+		yield from self.visit_children(tree)
+
+		# parents are known now
+		for type_ in self.scope.types.values():
+			if type_.class_ref:
+				type_.class_ref.build_layout()
 
-		type_ = self.visit(tree.children[0])
+	def variable(self, tree):
+		type_ = yield tree.children[0]
 		var_name = tree.children[1].value
-		variable = tree.symbol_table.find_var(var_name, tree=tree)
+		variable = self.scope.find_var(var_name, tree=tree)
 
 		variable.type_ = type_
 
 	def type(self, tree):
 		type_name = tree.children[0].value
-		type_ = tree.symbol_table.find_type(type_name, tree=tree)
+		type_ = self.scope.find_type(type_name, tree=tree)
 
 		return type_
 
 	def array_type(self, tree):
-		arr_type = self.visit(tree.children[0])
-		type_ = Type(name="array", arr_type=arr_type)
+		arr_type = yield tree.children[0]
+		type_ = arr_type.array()
 
 		return type_
 
@@ -716,10 +719,10 @@ class TypeVisitor(Interpreter):
 
 		class_name = tree.children[1].value
 
-		class_ = tree.symbol_table.find_type(class_name).class_ref
+		class_ = self.scope.find_type(class_name).class_ref
 		
 		if class_.parent:
-			parent_class = tree.symbol_table.find_type(class_.parent).class_ref
+			parent_class = self.scope.find_type(class_.parent).class_ref
 			if not parent_class:
 				raise SemanticError("Can only extend from classes")
 			
@@ -727,7 +730,7 @@ class TypeVisitor(Interpreter):
 		
 		for child in tree.children:
 			if isinstance(child, Tree):
-				self.visit(child)
+				yield child
 		
 
 	def function_decl(self, tree):
@@ -735,21 +738,122 @@ class TypeVisitor(Interpreter):
 
 		# type
 		
-		type_ = Type("void")
+		type_ = builtin_types["void"]
 		if isinstance(tree.children[0], Tree):
-			type_ = self.visit(tree.children[0])
+			type_ = yield tree.children[0]
 		
 
 		# name
 		func_name = tree.children[1].value
-		function = tree.symbol_table.find_func(func_name, tree=tree)
+		function = self.scope.find_func(func_name, tree=tree)
 
 		function.return_type = type_
 
 				
 		for child in tree.children:
 			if isinstance(child, Tree):
-				self.visit(child)
+				yield child
 		
 
-	
\ No newline at end of file
+	
+
+
+
+class NameResolver(ScopeVisitor):
+	"""
+	Binds identifiers to symbols once, so Cgen does no scope lookups.
+	Runs after TypeVisitor (class layouts are needed for fields and
+	methods used without 'this'). Fills context.resolved (by id(node)):
+
+		function_decl, variable			Function, Variable
+		type, new_ident, class_decl		Type
+		l_value_ident					('var', variable) or ('field', variable, index, this)
+		call							('function', function) or ('method', function, index, this)
+	"""
+
+	def __init__(self, context):
+		super().__init__(context)
+		# variables of the enclosing scopes except the global one, by name.
+		# entering a scope saves the names it shadows, leaving restores them
+		self.visible = {}
+		self.shadowed = []
+
+	def __default__(self, tree):
+		yield from self.visit_children(tree)
+
+	def enter_scope(self, scope):
+		if scope.parent is None:
+			return
+		self.shadowed.append([(name, self.visible.get(name)) for name in scope.variables])
+		self.visible.update(scope.variables)
+
+	def exit_scope(self, scope):
+		if scope.parent is None:
+			return
+		for name, variable in self.shadowed.pop():
+			if variable is None:
+				del self.visible[name]
+			else:
+				self.visible[name] = variable
+
+	def lookup_var(self, name, tree):
+		variable = self.visible.get(name) or self.context.global_scope.variables.get(name)
+		if variable is None:
+			raise SemanticError(f'Variable {name} not found in this scope', tree=tree)
+		return variable
+
+	def resolve(self, tree, symbol):
+		self.context.resolved[id(tree)] = symbol
+		return symbol
+
+
+	def class_decl(self, tree):
+		type_ = self.resolve(tree, self.scope.resolve_type(tree.children[1].value, tree=tree))
+
+		self.context.class_stack.append(type_.class_ref)
+		yield from self.visit_children(tree)
+		self.context.class_stack.pop()
+
+	def function_decl(self, tree):
+		# self.scope is the scope of the formals
+		self.resolve(tree, self.scope.find_func(tree.children[1].value, tree=tree))
+		yield from self.visit_children(tree)
+
+	def variable(self, tree):
+		# declared in this scope
+		self.resolve(tree, self.scope.variables[tree.children[1].value])
+		yield from self.visit_children(tree)
+
+	def type(self, tree):
+		self.resolve(tree, self.scope.resolve_type(tree.children[0].value, tree=tree))
+
+	def new_ident(self, tree):
+		self.resolve(tree, self.scope.resolve_type(tree.children[1].value, tree=tree))
+
+
+	def l_value_ident(self, tree):
+		var_name = tree.children[0].value
+
+		# locals and formals, then fields of the class (also inherited ones), then globals
+		variable = self.visible.get(var_name)
+		if self.context.class_stack:
+			class_var, index = self.context.class_stack[-1].get_var_and_index(var_name, error=False)
+			if class_var and (variable is None or variable is class_var):
+				self.resolve(tree, ('field', class_var, index, self.lookup_var('this', tree)))
+				return
+
+		self.resolve(tree, ('var', variable or self.lookup_var(var_name, tree)))
+
+	def call(self, tree):
+		function_name = tree.children[0].value
+
+		# methods of the class, then global functions
+		if self.context.class_stack:
+			method, index = self.context.class_stack[-1].get_func_and_index(function_name, error=False)
+			if method:
+				self.resolve(tree, ('method', method, index, self.lookup_var('this', tree)))
+				yield from self.visit_children(tree)
+				return
+
+		self.resolve(tree, ('function', self.scope.resolve_func(function_name, tree=tree)))
+		yield from self.visit_children(tree)
@@ -0,0 +1,177 @@
+import io
+
+
+# three address code
+#
+#	dst = op args		(dst is a Temp or None)
+#
+# operands are Temps, python ints (immediates), Variables of the symbol
+# table (loadvar / storevar) and label names (label field).
+#
+# ops:
+#	li, li.s, la							constants and labels
+#	move
+#	add sub mul div rem seq sne slt sle sgt sge and or		int, args may be immediates
+#	addu					add that wraps instead of trapping on overflow
+#	neg not
+#	add.s sub.s mul.s div.s neg.s
+#	c.eq.s c.ne.s c.lt.s c.le.s c.gt.s c.ge.s		double compare, int result
+#	itod dtoi
+#	load (base, offset)		store (src, base, offset)
+#	loadvar (var)			storevar (var, src)
+#	label goto beqz bnez beq bne blt ble bgt bge
+#	beq.s bne.s blt.s ble.s bgt.s bge.s		double compare and branch
+#	call (args...) 		callr (function_address, args...)
+#	return (value?)
+#	builtin (args...)		label is the builtin name, see BUILTINS
+
+
+BUILTINS = {
+	# name: returns value
+	'print_int': False,
+	'print_double': False,
+	'print_string': False,
+	'print_bool': False,
+	'print_newline': False,
+	'read_int': True,
+	'read_line': True,
+	'alloc': True,
+	'string_concat': True,
+	'string_equal': True,
+	'array_concat': True,
+}
+
+DOUBLE_BRANCHES = {'beq.s', 'bne.s', 'blt.s', 'ble.s', 'bgt.s', 'bge.s'}
+BRANCHES = {'beqz', 'bnez', 'beq', 'bne', 'blt', 'ble', 'bgt', 'bge', *DOUBLE_BRANCHES}
+JUMPS = {'goto', *BRANCHES}
+OVERFLOW_OPS = {'add', 'sub', 'neg'}		# trap on overflow (mips add, addi, sub)
+
+
+class Temp():
+	__slots__ = ('id', 'is_float')
+
+	def __init__(self, id, is_float=False):
+		self.id = id
+		self.is_float = is_float
+
+	def __repr__(self):
+		return f"_{'f' if self.is_float else 't'}{self.id}"
+
+
+class Instr():
+	__slots__ = ('op', 'dst', 'args', 'label')
+
+	def __init__(self, op, dst=None, args=(), label=None):
+		self.op = op
+		self.dst = dst
+		self.args = args
+		self.label = label
+
+	def uses(self):
+		# temps read by this instruction
+		return [a for a in self.args if isinstance(a, Temp)]
+
+	def __str__(self):
+		op = self.op
+		if op == 'label':
+			return f"{self.label}:"
+
+		args = ', '.join(operand_str(a) for a in self.args)
+		if op in ('li', 'li.s', 'move'):
+			text = args
+		elif op == 'la':
+			text = f"&{self.label}"
+		elif op == 'load':
+			text = f"*({operand_str(self.args[0])} + {self.args[1]})"
+		elif op == 'store':
+			text = f"*({operand_str(self.args[1])} + {self.args[2]}) = {operand_str(self.args[0])}"
+		elif op == 'loadvar':
+			text = operand_str(self.args[0])
+		elif op == 'storevar':
+			text = f"{operand_str(self.args[0])} = {operand_str(self.args[1])}"
+		elif op in JUMPS:
+			text = f"{op} {args} {self.label}" if args else f"{op} {self.label}"
+		elif op in ('call', 'builtin'):
+			text = f"{op} {self.label}({args})"
+		elif op == 'callr':
+			text = f"callr *{operand_str(self.args[0])}({', '.join(operand_str(a) for a in self.args[1:])})"
+		else:
+			text = f"{op} {args}"
+
+		if self.dst is not None:
+			return f"\t{self.dst} = {text}"
+		return f"\t{text}"
+
+
+def operand_str(a):
+	if isinstance(a, (Temp, int, float, str)):
+		return str(a)
+	# symbol table variable
+	return f"{a.name}@{a.storage}:{a.address}"
+
+
+class IRFunction():
+	"""
+	Body of one function (or method) as a list of Instr.
+	Temps and labels are numbered per function, so the code of a
+	function does not depend on the rest of the program.
+	"""
+
+	def __init__(self, label, formals):
+		self.label = label
+		self.formals = formals
+		self.code = []
+		self.temps_count = 0
+		self.labels_count = 0
+
+	def new_temp(self, is_float=False):
+		temp = Temp(self.temps_count, is_float)
+		self.temps_count += 1
+		return temp
+
+	def new_label(self, name):
+		self.labels_count += 1
+		return f'_{self.label}_{name}_{self.labels_count}'
+
+	def emit(self, op, dst=None, *args, label=None):
+		self.code.append(Instr(op, dst, args, label))
+		return dst
+
+	def __str__(self):
+		lines = [f"{self.label}({', '.join(f.name for f in self.formals)}):"]
+		lines.extend(str(instr) for instr in self.code)
+		return '\n'.join(lines)
+
+
+class IRClass():
+	def __init__(self, name, vtable, object_size):
+		self.name = name
+		self.vtable = vtable		# function labels, None for unused slots
+		self.object_size = object_size
+
+	@property
+	def vtable_label(self):
+		return f"vtable_{self.name}"
+
+
+class Program():
+	"""
+	Output of the lowering pass (Cgen), input of the mips backend.
+	"""
+
+	def __init__(self):
+		self.functions = []
+		self.classes = []
+		self.strings = []		# (label, value)
+
+	def getvalue(self):
+		s = io.StringIO()
+		for label, string in self.strings:
+			s.write(f'{label}: "{string}"\n')
+		for class_ in self.classes:
+			s.write(f"{class_.vtable_label}: {', '.join(str(l) for l in class_.vtable)}\n")
+		for function in self.functions:
+			s.write('\n')
+			s.write(str(function))
+			s.write('\n')
+		return s.getvalue()
@@ -0,0 +1,337 @@
+from lark import Tree
+
+from interpreter import Interpreter
+from symbol_table import builtin_types
+from utils import SemanticError
+
+
+class TypeChecker(Interpreter):
+	"""
+	Semantic checks of the statements and expressions, after NameResolver:
+	operand types, arguments of calls, access modes, overrides, return
+	types and break/continue outside of loops.
+
+	Expression visitors return their Type. Cgen only runs on programs
+	that passed, so it does not check anything itself.
+	"""
+
+	def __init__(self, context):
+		self.context = context
+		self.resolved = context.resolved
+		self.types = context.global_scope.types
+		self.loops = 0		# number of enclosing for/while
+
+
+	def check_access(self, class_, name, message, tree):
+		current_scope_class = None
+		if len(self.context.class_stack) > 0:
+			current_scope_class = self.context.class_stack[-1]
+
+		access_mode = class_.get_access_mode(name)
+
+		if access_mode == 'private' and (not current_scope_class or class_.name != current_scope_class.name) or\
+		 access_mode == 'protected' and (not current_scope_class or not current_scope_class.can_upcast_to(class_)):
+			raise SemanticError(message, tree=tree)
+
+	def check_arguments(self, function, function_name, arguments, tree):
+		# arguments are the types of actuals ('this' included for methods)
+		if len(arguments) != len(function.formals):
+			raise SemanticError(f"function '{function_name}' arguments number are not matched", tree=tree)
+
+		for formal, arg in zip(function.formals, arguments):
+			if not arg.are_equal_with_upcast(formal.type_):
+				raise SemanticError(f"function '{function_name}' arguments not matched with formals", tree=tree)
+
+	def check_overrides(self, class_, tree):
+		all_parent_classes = []
+		now_class = class_
+		while now_class:
+			all_parent_classes.append(now_class)
+			now_class = now_class.parent
+
+		all_funcs = {}
+		all_values = set()
+		for now_class in all_parent_classes[::-1]:
+			for f in now_class.member_functions.values():
+				func = all_funcs.get(f.name)
+				if func:	# override, 'this' (first formal) is different
+					if len(func.formals) != len(f.formals) or\
+					 any(not a.type_.are_equal(b.type_) for a, b in zip(func.formals[1:], f.formals[1:])):
+						raise SemanticError("override function should have same arguments", tree=tree)
+					if func.return_type.name != f.return_type.name:
+						raise SemanticError("override function should have same return types", tree=tree)
+				all_funcs[f.name] = f
+
+			for v in now_class.member_data.values():
+				if v.name in all_values:
+					raise SemanticError("variables can't be overriden", tree=tree)
+				all_values.add(v.name)
+
+
+	def class_decl(self, tree):
+		class_ = self.resolved[id(tree)].class_ref
+		self.check_overrides(class_, tree)
+
+		self.context.class_stack.append(class_)
+		yield from self.visit_children(tree)
+		self.context.class_stack.pop()
+
+	def interface_decl(self, tree):
+		pass
+
+	def variable(self, tree):
+		pass
+
+	def function_decl(self, tree):
+		self.context.stack_of_functions.append(self.resolved[id(tree)])
+		yield tree.children[3]
+		self.context.stack_of_functions.pop()
+
+
+	def return_stmt(self, tree):
+		if len(self.context.stack_of_functions) == 0:
+			raise SemanticError("return can only be used in function", tree=tree)
+
+		function = self.context.stack_of_functions[-1]
+
+		type_ = builtin_types['void']
+		if len(tree.children) > 1:
+			type_ = yield tree.children[1]
+
+		if type_.name != function.return_type.name:
+			raise SemanticError("return type does not match function declaration", tree=tree)
+
+	def loop(self, tree, body):
+		for subtree in tree.children:
+			if isinstance(subtree, Tree) and subtree is not body:
+				yield subtree
+
+		self.loops += 1
+		yield body
+		self.loops -= 1
+
+	def while_stmt(self, tree):
+		yield from self.loop(tree, tree.children[2])
+
+	def for_stmt(self, tree):
+		yield from self.loop(tree, tree.children[-1])
+
+	def break_stmt(self, tree):
+		if not self.loops:
+			raise SemanticError("break can only be used in for/while", tree=tree)
+
+	def continue_stmt(self, tree):
+		if not self.loops:
+			raise SemanticError("continue can only be used in for/while", tree=tree)
+
+
+	def call(self, tree):
+		function_name = tree.children[0].value
+		kind, function, *method = self.resolved[id(tree)]
+
+		arguments = yield tree.children[1]
+		if kind == 'method':	# 'this' is the first argument
+			arguments = [method[1].type_, *arguments]
+
+		self.check_arguments(function, function_name, arguments, tree)
+		return function.return_type
+
+	def method_call(self, tree):
+		type_ = yield tree.children[0]
+		class_ = type_.class_ref
+		function_name = tree.children[1].value
+
+		if not class_:
+			if type_.name == "array":
+				if function_name == "length":
+					return self.types['int']
+				raise SemanticError("No such function available for array", tree=tree)
+
+			raise SemanticError("Method call only allowed on objects and array", tree=tree)
+
+		function, _ = class_.get_func_and_index(function_name, tree=tree)
+		self.check_access(class_, function_name, "You don't have access to method", tree)
+
+		arguments = [type_, *(yield tree.children[2])]
+		self.check_arguments(function, function_name, arguments, tree)
+		return function.return_type
+
+	def new_ident(self, tree):
+		type_ = self.resolved[id(tree)]
+		if not type_.class_ref:
+			raise SemanticError("New must be used with class name", tree=tree)
+		return type_
+
+	def new_array(self, tree):
+		yield tree.children[0]
+		mem_type = yield tree.children[1]
+		return mem_type.array()
+
+	def type(self, tree):
+		return self.resolved[id(tree)]
+
+	def array_type(self, tree):
+		arr_type = yield tree.children[0]
+		return arr_type.array()
+
+
+	def expr_assign(self, tree):
+		lvalue_type = yield tree.children[0]
+		expr_type = yield tree.children[1]
+
+		if not expr_type.are_equal_with_upcast(lvalue_type):
+			raise SemanticError(f"lvalue type \n'{lvalue_type}'\n != expr type \n'{expr_type}'\n in 'expr_assign'", tree=tree)
+		return lvalue_type
+
+	def l_value_ident(self, tree):
+		return self.resolved[id(tree)][1].type_
+
+	def l_value_class_field(self, tree):
+		type_ = yield tree.children[0]
+		class_ = type_.class_ref
+		if not class_:
+			raise SemanticError("dot(.) for fields can only used with classes", tree=tree)
+
+		field_name = tree.children[1].value
+		class_var, _ = class_.get_var_and_index(field_name, tree=tree)
+		self.check_access(class_, field_name, "You don't have access to field", tree)
+		return class_var.type_
+
+	def l_value_array(self, tree):
+		array_type = yield tree.children[0]
+		index_type = yield tree.children[1]
+
+		if index_type.name != 'int':
+			raise SemanticError('index type is not int', tree = tree)
+
+		if array_type.name != 'array':
+			raise SemanticError('left side type is not array', tree = tree)
+
+		return array_type.arr_type
+
+	def constant(self, tree):
+		return {
+			'INTCONSTANT': self.types['int'],
+			'DOUBLECONSTANT': self.types['double'],
+			'BOOLCONSTANT': self.types['bool'],
+			'STRINGCONSTANT': self.types['string'],
+			'NULL': builtin_types['null'],
+		}[tree.children[0].type]
+
+	def read_line(self, tree):
+		return self.types['string']
+
+	def read_integer(self, tree):
+		return self.types['int']
+
+
+	def binary_operands(self, tree):
+		# both operands have the same type (by name)
+		type1 = yield tree.children[0]
+		type2 = yield tree.children[1]
+		if type1.name != type2.name:
+			raise SemanticError(f'var1 type != var2 type in \'{tree.data}\'', tree=tree)
+		return type1, type2
+
+	def add(self, tree):
+		type1, type2 = yield from self.binary_operands(tree)
+		if type1.name in ('int', 'double', 'string') or\
+		 type1.name == 'array' and type1.arr_type.are_equal(type2.arr_type):
+			return type1
+		raise SemanticError('types are not suitable for \'add\'', tree=tree)
+
+	def arithmetic(self, tree, types):
+		type_, _ = yield from self.binary_operands(tree)
+		if type_.name not in types:
+			raise SemanticError(f'types are not suitable for \'{tree.data}\'', tree=tree)
+		return type_
+
+	def sub(self, tree):
+		return (yield from self.arithmetic(tree, ('int', 'double')))
+
+	def mul(self, tree):
+		return (yield from self.arithmetic(tree, ('int', 'double')))
+
+	def div(self, tree):
+		return (yield from self.arithmetic(tree, ('int', 'double')))
+
+	def mod(self, tree):
+		return (yield from self.arithmetic(tree, ('int',)))
+
+	def neg(self, tree):
+		type_ = yield tree.children[0]
+		if type_.name not in ('int', 'double'):
+			raise SemanticError('types are not suitable for \'neg\'', tree=tree)
+		return type_
+
+	def boolean_operation(self, tree):
+		type_, _ = yield from self.binary_operands(tree)
+		if type_.name != 'bool':
+			raise SemanticError(f'variables type are not bool \'{tree.data}\'', tree=tree)
+		return type_
+
+	def boolean_or(self, tree):
+		return (yield from self.boolean_operation(tree))
+
+	def boolean_and(self, tree):
+		return (yield from self.boolean_operation(tree))
+
+	def equality(self, tree):
+		type1 = yield tree.children[0]
+		type2 = yield tree.children[1]
+
+		ok = (not (type1.name == 'null' and type2.name == 'null')) and\
+			(type1.name == type2.name or\
+			(type1.name == 'null' and type2.name not in ['double', 'int', 'bool', 'string', 'array']) or\
+			(type2.name == 'null' and type1.name not in ['double', 'int', 'bool', 'string', 'array']))
+		if not ok:
+			raise SemanticError(f'types are not suitable for \'{tree.data}\'', tree=tree)
+		return self.types['bool']
+
+	def equal(self, tree):
+		return (yield from self.equality(tree))
+
+	def not_equal(self, tree):
+		return (yield from self.equality(tree))
+
+	def relational(self, tree):
+		type_, _ = yield from self.binary_operands(tree)
+		if type_.name not in ('int', 'double'):
+			raise SemanticError(f'types are not suitable for \'{tree.data}\'', tree=tree)
+		return self.types['bool']
+
+	def less_than(self, tree):
+		return (yield from self.relational(tree))
+
+	def less_equal(self, tree):
+		return (yield from self.relational(tree))
+
+	def greater_than(self, tree):
+		return (yield from self.relational(tree))
+
+	def greater_equal(self, tree):
+		return (yield from self.relational(tree))
+
+	def not_expr(self, tree):
+		type_ = yield tree.children[0]
+		if type_.name != 'bool':
+			raise SemanticError('variable type is not bool in \'not_expr\'', tree=tree)
+		return type_
+
+	def cast(self, tree, from_type, to_type, from_name):
+		type_ = yield tree.children[1]
+		if type_.name != from_type:
+			raise SemanticError(f'variable type is not {from_name} in \'{tree.data}\'', tree=tree)
+		return self.types[to_type]
+
+	def itod(self, tree):
+		return (yield from self.cast(tree, 'int', 'double', 'integer'))
+
+	def dtoi(self, tree):
+		return (yield from self.cast(tree, 'double', 'int', 'double'))
+
+	def itob(self, tree):
+		return (yield from self.cast(tree, 'int', 'bool', 'integer'))
+
+	def btoi(self, tree):
+		return (yield from self.cast(tree, 'bool', 'int', 'bool'))